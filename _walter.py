@@ -208,6 +208,17 @@ class ModemPDPContextState:
     ATTACHED = 4
 
 
+"""The bits of the flags word of a PDP context, create_PDP_context packs and
+unpacks the flags only through these names."""
+class ModemPDPContextFlag:
+    FOR_IMCN = 1
+    USE_NSLPI = 2
+    USE_SECURE_PCO = 4
+    USE_NAS_IPV4_MTU_DISCOVERY = 8
+    USE_LOCAL_ADDR_IND = 16
+    USE_NAS_NON_IPMTU_DISCOVERY = 32
+
+
 """The supported packet data protocol types."""
 class ModemPDPType:
     X25 = 0
@@ -535,10 +546,19 @@ class ModemBandSelection:
         
 
 class ModemHttpResponse:
-    """This class represents a http response."""
+    """This class represents a http response. There is one instance per http
+    profile which is reused for every response on that profile, copy what
+    you need before the next http_did_ring on the same profile."""
     def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Reset the response so it can be reused for the next response."""
         self.http_status = 0
         self.content_length = 0
+
+        """The body, as a memoryview on the received response to avoid
+        copying it, use bytes(data) to get a copy."""
         self.data = b''
         self.content_type = ''
 
@@ -557,6 +577,11 @@ class ModemRsp:
     """This class represents a response 
     """
     def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clear the response so it can be reused for another command."""
+
         """The result of the executed command."""
         self.result = ModemState.OK
 
@@ -657,6 +682,10 @@ class ModemCmd:
         
         """Pointer to the response object to store the command results in."""
         self.rsp = None
+
+        """The response type a response line that matches no handler is
+        stored as, or None when such lines are not part of the response."""
+        self.collect_rsp_type = None
         
         """Pointer to a function which is called before the command user
         callback is called. This pointer is used to manage internal library 
@@ -675,8 +704,9 @@ class ModemATParserData:
         """The FSM state the parser currently is in."""
         self.state = ModemRspParserState.START_CR
         
-        """The buffer currently used by the parser."""
-        self.line = b''
+        """The buffer currently used by the parser, it is grown in place and
+        only copied into an immutable response once the line is complete."""
+        self.line = bytearray()
 
         """In raw data chunk parser state, we remember nr expected bytes"""
         self.raw_chunk_size = 0
@@ -729,28 +759,9 @@ class ModemPDPContext:
         """The method to use for p-CSCF discovery"""
         self.pcscf_method = ModemPDPPCSCFDiscoveryMethod.AUTO
         
-        """Flag indicating if the PDP context is used for IM CN 
-        subsystem-related signalling"""
-        self.for_IMCN = False
-        
-        """Flag indicating if the PDP context should use Non-Access Stratum 
-        (NAS) Signalling Low Priority Indication (NSLPI)"""
-        self.use_NSLPI = False
-        
-        """Flag indicating if the Protocol Configuration Options (PCO) should be protected"""
-        self.use_secure_PCO = False
-        
-        """Flag indicating if NAS signalling should be used to discover the 
-        IPv4 MTU"""
-        self.use_NAS_ipv4_MTU_discovery = False
-        
-        """Flag indicating if the system supports local IP addresses in the 
-        Traffic Flow Template (TFT)"""
-        self.use_local_addr_ind = False
-        
-        """Flag indicating if NAS should be used to discover the MTU of non-IP
-        PDP contexts"""
-        self.use_NAS_non_IPMTU_discovery = False
+        """The boolean options of the PDP context packed as
+        ModemPDPContextFlag bits."""
+        self.flags = 0
         
         """"The authentication protocol used to activate the PDP"""
         self.auth_proto = ModemPDPAuthProtocol.NONE
@@ -761,6 +772,48 @@ class ModemPDPContext:
         """The password to authenticate"""
         self.auth_pass = ""
 
+        """The AT+CGDCONT command which defined this context on the modem or
+        None when the context is not defined."""
+        self.cgdcont = None
+
+        """The AT+CGAUTH command with the quoted credentials of this context or
+        None when the context does not use authentication."""
+        self.cgauth = None
+
+        """Flag indicating if cgauth has been accepted by the modem."""
+        self.auth_applied = False
+
+    @property
+    def for_IMCN(self):
+        """Is the PDP context used for IM CN subsystem-related signalling."""
+        return bool(self.flags & ModemPDPContextFlag.FOR_IMCN)
+
+    @property
+    def use_NSLPI(self):
+        """Does the PDP context use NSLPI."""
+        return bool(self.flags & ModemPDPContextFlag.USE_NSLPI)
+
+    @property
+    def use_secure_PCO(self):
+        """Does the PDP context use secure protocol config options."""
+        return bool(self.flags & ModemPDPContextFlag.USE_SECURE_PCO)
+
+    @property
+    def use_NAS_ipv4_MTU_discovery(self):
+        """Does the PDP context use NAS for IPv4 MTU discovery."""
+        return bool(self.flags & ModemPDPContextFlag.USE_NAS_IPV4_MTU_DISCOVERY)
+
+    @property
+    def use_local_addr_ind(self):
+        """Does the PDP context support local IP address indication."""
+        return bool(self.flags & ModemPDPContextFlag.USE_LOCAL_ADDR_IND)
+
+    @property
+    def use_NAS_non_IPMTU_discovery(self):
+        """Does the PDP context use NAS for non-IP MTU discovery."""
+        return bool(
+            self.flags & ModemPDPContextFlag.USE_NAS_NON_IPMTU_DISCOVERY)
+
 
 class ModemSocket:
     """This class represents a socket."""
@@ -798,6 +851,10 @@ class ModemSocket:
         case a DNS query will be executed in the background."""
         self.remote_host = ""
 
+        """The remote host quoted for the AT commands, kept in sync with
+        remote_host by the modem library."""
+        self.remote_host_quoted = ""
+
         """The remote port to connect to."""
         self.remote_port = 0
 
@@ -816,12 +873,22 @@ class ModemGnssFixWaiter:
 class ModemHttpContext:
     """This class represents a socket."""
     def __init__(self):
+        """The response handed out for this profile, reused every time."""
+        self.response = ModemHttpResponse()
+
+        self.reset()
+
+    def reset(self):
+        """Reset the context to its initial state, keeping the object."""
         self.connected = False
         self.state = ModemHttpContextState.IDLE
         self.http_status = 0
         self.content_length = 0
         self.content_type = ''
 
+        """The configuration last applied with AT+SQNHTTPCFG or None."""
+        self.config = None
+
 class ModemTlsVersion:
     V10 = 0
     V11 = 1
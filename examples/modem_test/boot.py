@@ -259,7 +259,7 @@ async def loop():
 
             print('http status code: %d' % rsp.http_response.http_status)
             print('content type: %s' % rsp.http_response.content_type)
-            print(rsp.http_response.data)
+            print(bytes(rsp.http_response.data))
 
         else:
             print('http response not yet received')
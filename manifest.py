@@ -0,0 +1,13 @@
+# manifest.py: freezes the Walter modem library into the MicroPython firmware
+#
+# Only the library modules are listed, the examples and boot.py are
+# application code and stay on the filesystem. The default manifest of the
+# port is included so the modules frozen by default (uasyncio, ...) are kept.
+# The modules are compiled at optimisation level 3, like mpy-cross -O3, which
+# leaves out the docstrings, asserts and line numbers.
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+module("walter.py", opt=3)
+module("_walter.py", opt=3)
+module("queue.py", opt=3)
@@ -35,12 +35,12 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 from machine import Pin, UART
+from micropython import const
+from ucollections import deque
 import time
 import uasyncio
-import uselect
-import sys
-import random
 from queue import Queue
+import _walter
 
 CR = 13
 LF = 10
@@ -114,8 +114,109 @@ The max nr of tls profiles
 """
 WALTER_MODEM_MAX_TLS_PROFILES = 3
 
+"""
+The length of the I/O queue requested from the fast_io fork of uasyncio.
+"""
+WALTER_MODEM_IOQ_LEN = 16
 
-import _walter
+"""
+The max nr of MQTT messages waiting to be downloaded or to be read
+"""
+WALTER_MODEM_MQTT_MAX_PENDING_MSGS = 32
+
+"""
+The max length of the payload of an MQTT message the modem can publish
+"""
+WALTER_MODEM_MQTT_MAX_MESSAGE_LEN = 4096
+
+"""
+The default max nr of MQTT messages downloaded in one batch
+"""
+WALTER_MODEM_MQTT_RECEIVE_BATCH = 8
+
+"""
+The lengths of the response prefixes stripped before parsing the URCs and
+command responses, and of the trailing OK after the body of a SQNHTTPRCV
+answer.
+"""
+_LEN_HTTP_RING = const(14)          # len('+SQNHTTPRING: ')
+_LEN_HTTP_CONNECT = const(17)       # len('+SQNHTTPCONNECT: ')
+_LEN_HTTP_DISCONNECT = const(20)    # len('+SQNHTTPDISCONNECT: ')
+_LEN_HTTP_SH = const(12)            # len('+SQNHTTPSH: ')
+_LEN_HTTP_TAIL = const(6)           # len('\r\nOK\r\n')
+_LEN_SQNBANDSEL = const(13)         # len('+SQNBANDSEL: ')
+_LEN_CEREG = const(8)               # len('+CEREG: ')
+_LEN_CME_ERROR = const(12)          # len('+CME ERROR: ')
+_LEN_CFUN = const(7)                # len('+CFUN: ')
+_LEN_SQNMODEACTIVE = const(16)      # len('+SQNMODEACTIVE: ')
+_LEN_CPIN = const(7)                # len('+CPIN: ')
+_LEN_CGPADDR = const(10)            # len('+CGPADDR: ')
+_LEN_CSQ = const(6)                 # len('+CSQ: ')
+_LEN_CCLK = const(7)                # len('+CCLK: ')
+_LEN_SQNSH = const(8)               # len('+SQNSH: ')
+_LEN_GNSS_FIX = const(17)           # len('+LPGNSSFIXREADY: ')
+_LEN_GNSS_ASSISTANCE = const(19)    # len('+LPGNSSASSISTANCE: ')
+_LEN_MQTT_ONMESSAGE = const(19)     # len('+SQNSMQTTONMESSAGE:')
+
+"""
+The max nr of cached MQTT publish command prefixes
+"""
+_MQTT_PUB_PREFIX_CACHE_SIZE = const(16)
+
+"""
+The max nr of cached quoted MQTT topics
+"""
+_MQTT_TOPIC_CACHE_SIZE = const(32)
+
+"""
+The max nr of interned MQTT topics
+"""
+_MQTT_TOPIC_POOL_SIZE = const(32)
+
+"""
+The interval in ms at which ModemHttpBatcher polls for the answer to a post
+"""
+_HTTP_BATCH_RING_POLL_MS = const(100)
+
+"""
+AT command templates of the PDP, socket, HTTP and MQTT commands. Formatting a bytes
+template directly yields the bytes that are written to the UART, str
+arguments such as the result of modem_string are formatted into it as is.
+"""
+# two queries without side effects chained on one line
+_AT_CHAIN_PROBE = b'AT+CMEE?;+CMEE?'
+_AT_CGDCONT = b'AT+CGDCONT=%d,%s,%s,%s,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d'
+_AT_CGAUTH = b'AT+CGAUTH=%d,%d,%s,%s'
+_AT_CGACT = b'AT+CGACT=%d,%d'
+# indexed by the attach state, there are only two possible commands
+_AT_CGATT = (b'AT+CGATT=0', b'AT+CGATT=1')
+_AT_CGPADDR = b'AT+CGPADDR=%d'
+_AT_SQNSCFG = b'AT+SQNSCFG=%d,%d,%d,%d,%d,%d'
+# the commands that only take the socket id, indexed by socket id - 1
+_AT_SQNSCFGEXT = tuple(b'AT+SQNSCFGEXT=%d,2,0,0,0,0,0' % (idx + 1)
+    for idx in range(WALTER_MODEM_MAX_SOCKETS))
+_AT_SQNSH = tuple(b'AT+SQNSH=%d' % (idx + 1)
+    for idx in range(WALTER_MODEM_MAX_SOCKETS))
+_AT_SQNSD = b'AT+SQNSD=%d,%d,%d,%s,0,%d,1,%d,0'
+_AT_SQNSSENDEXT = b'AT+SQNSSENDEXT=%d,%d,%d'
+_AT_HTTP_RCV = b'AT+SQNHTTPRCV=%d'
+_AT_HTTP_CFG = b'AT+SQNHTTPCFG=%d,%s,%s,%d,"%s","%s"'
+_AT_HTTP_CONNECT = b'AT+SQNHTTPCONNECT=%d'
+_AT_HTTP_DISCONNECT = b'AT+SQNHTTPDISCONNECT=%d'
+_AT_HTTP_QRY = b'AT+SQNHTTPQRY=%d,%d,%s'
+_AT_HTTP_SND = b'AT+SQNHTTPSND=%d,%d,%s,%d'
+_AT_HTTP_SND_PARAM = b'AT+SQNHTTPSND=%d,%d,%s,%d,"%d"'
+_AT_MQTT_CFG = b'AT+SQNSMQTTCFG=0,%s,%s,%s,%s'
+_AT_MQTT_CONNECT = b'AT+SQNSMQTTCONNECT=0,%s,%s'
+_RSP_MQTT_CONNECT = b'+SQNSMQTTONCONNECT:0,0'
+_AT_MQTT_DISCONNECT = b'AT+SQNSMQTTDISCONNECT=0'
+_RSP_MQTT_DISCONNECT = b'+SQNSMQTTONDISCONNECT:0,0'
+_AT_MQTT_PUBLISH_PREFIX = b'AT+SQNSMQTTPUBLISH=0,%s,%d,'
+_AT_MQTT_SUBSCRIBE = b'AT+SQNSMQTTSUBSCRIBE=0,%s,%d'
+_AT_MQTT_RCV = b'AT+SQNSMQTTRCVMESSAGE=0,%s'
+_AT_MQTT_RCV_ID = b'AT+SQNSMQTTRCVMESSAGE=0,%s,%s'
+_AT_MQTT_RCV_ID_LEN = b'AT+SQNSMQTTRCVMESSAGE=0,%s,%s,%d'
+_RSP_MQTT_SUBSCRIBE = b'+SQNSMQTTONSUBSCRIBE:0,%s'
 
 
 def modem_string(a_string):
@@ -124,6 +225,23 @@ def modem_string(a_string):
     else:
         return ''
 
+"""
+Quoted MQTT topics by topic, filled until it holds
+_MQTT_TOPIC_CACHE_SIZE entries and emptied on a modem reset.
+"""
+_mqtt_topic_cache = {}
+
+def modem_topic_string(topic):
+    """modem_string for MQTT topics, which are repeated on every publish,
+    subscribe and receive and therefore cached."""
+    quoted = _mqtt_topic_cache.get(topic)
+    if quoted is None:
+        quoted = modem_string(topic)
+        if len(_mqtt_topic_cache) < _MQTT_TOPIC_CACHE_SIZE:
+            _mqtt_topic_cache[topic] = quoted
+
+    return quoted
+
 def modem_bool(a_bool):
     if a_bool:
         return 1
@@ -138,20 +256,20 @@ def modem_number(a_number):
     
 def pdp_type_as_string(pdp_type):
     if pdp_type == _walter.ModemPDPType.X25:
-        return '"X.25"'
+        return b'"X.25"'
     if pdp_type == _walter.ModemPDPType.IP:
-        return '"IP"'
+        return b'"IP"'
     if pdp_type == _walter.ModemPDPType.IPV6:
-        return '"IPV6"'
+        return b'"IPV6"'
     if pdp_type == _walter.ModemPDPType.IPV4V6:
-        return '"IPV4V6"'
+        return b'"IPV4V6"'
     if pdp_type == _walter.ModemPDPType.OSPIH:
-        return '"OPSIH"'
+        return b'"OPSIH"'
     if pdp_type == _walter.ModemPDPType.PPP:
-        return '"PPP"'
+        return b'"PPP"'
     if pdp_type == _walter.ModemPDPType.NON_IP:
-        return '"Non-IP"'
-    return ''
+        return b'"Non-IP"'
+    return b''
 
 def parse_cclk_time(time_str):
     # format: yy/mm/dd,hh:nn:ss+qq
@@ -222,11 +340,74 @@ def static_rsp(result):
     rsp.result = result
     return rsp
 
+def _valid_http_profile(profile_id):
+    """Check if an http profile id passed to the API is in range."""
+    return 0 <= profile_id < WALTER_MODEM_MAX_HTTP_PROFILES
+
+def _valid_tls_profile(profile_id):
+    """Check if a tls profile id passed to the API is in range."""
+    return 0 <= profile_id < WALTER_MODEM_MAX_TLS_PROFILES
+
+async def _http_config_complete(result, rsp, ctx_config):
+    """Complete handler of http_config_profile, the argument is the http
+    context and the configuration that was sent."""
+    if result == _walter.ModemState.OK:
+        ctx, config = ctx_config
+        ctx.config = config
+
+async def _http_expect_ring_complete(result, rsp, ctx):
+    """Complete handler of http_query and http_send."""
+    if result == _walter.ModemState.OK:
+        ctx.state = _walter.ModemHttpContextState.EXPECT_RING
+
+async def _http_did_ring_complete(result, rsp, modem):
+    """Complete handler of http_did_ring."""
+    modem._http_ctx(modem._http_current_profile).state = _walter.ModemHttpContextState.IDLE
+    modem._http_current_profile = 0xff
+
+async def _pdp_create_complete(result, rsp, ctx):
+    """Complete handler of create_PDP_context."""
+    rsp.type = _walter.ModemRspType.PDP_CTX_ID
+    rsp.pdp_ctx_id = ctx.id
+
+    if result == _walter.ModemState.OK:
+        ctx.state = _walter.ModemPDPContextState.INACTIVE
+    else:
+        ctx.state = _walter.ModemPDPContextState.FREE
+
+async def _pdp_attach_complete(result, rsp, ctx):
+    """Complete handler of attach_PDP_context."""
+    if result == _walter.ModemState.OK and ctx:
+        ctx.state = _walter.ModemPDPContextState.ATTACHED
+
 class Modem:
     def __init__(self):
+        """The bound _run_cmd, cached to skip the method lookup on every
+        AT command."""
+        self._run = self._run_cmd
+
+        """The http contexts in the modem by profile id, a context is only
+        allocated on first use of its profile (see _http_ctx)."""
+        self._http_context_set = {}
+
+        """The AT+SQNSMQTTPUBLISH command up to the payload length by
+        (topic, qos), emptied when it holds _MQTT_PUB_PREFIX_CACHE_SIZE
+        entries."""
+        self._mqtt_pub_prefix_cache = {}
+
+        """Response objects reused by the receive commands of mqtt_receive"""
+        self._mqtt_rsp_pool = []
+
+        self._mirror_state_reset()
+
+    def _core_mirror_state_reset(self):
         """The current operational state of the modem."""
         self._op_state = _walter.ModemOpState.MINIMUM
 
+        """Flag indicating if _op_state was reported or set since the reset,
+        until then the operational state of the modem is not known."""
+        self._op_state_known = False
+
         """The current network registration state of the modem."""
         self._reg_state = _walter.ModemNetworkRegState.NOT_SEARCHING
 
@@ -240,6 +421,10 @@ class Modem:
         is used."""
         self._operator = _walter.ModemOperator()
 
+        """The name of _operator quoted for AT+COPS."""
+        self._operator_name_quoted = ""
+
+    def _pdp_mirror_state_reset(self):
         """The PDP context which is currently in use by the library or None when
         no PDP context is in use. In use doesn't mean that the 
         context is activated yet it is just a pointer to the PDP context
@@ -250,6 +435,15 @@ class Modem:
         """The list of PDP context."""
         self._pdp_ctx_set = [_walter.ModemPDPContext(idx + 1) for idx in range(WALTER_MODEM_MAX_PDP_CTXTS)]
 
+        """The indices in _pdp_ctx_set of the FREE PDP contexts."""
+        self._pdp_free = deque((), WALTER_MODEM_MAX_PDP_CTXTS)
+        for idx in range(WALTER_MODEM_MAX_PDP_CTXTS):
+            self._pdp_free.append(idx)
+
+        """The PDP context that was last activated or None."""
+        self._pdp_active_ctx = None
+
+    def _socket_mirror_state_reset(self):
         """The list of sockets"""
         self._socket_set = [ _walter.ModemSocket(idx + 1) for idx in range(WALTER_MODEM_MAX_SOCKETS) ]
 
@@ -257,21 +451,127 @@ class Modem:
         socket is in use."""
         self._socket = None
 
-        """The list of http contexts in the modem"""
-        self._http_context_set = [ _walter.ModemHttpContext() for _ in range(WALTER_MODEM_MAX_HTTP_PROFILES) ]
+    def _http_mirror_state_reset(self):
+        # the contexts that were already allocated are reset in place
+        for ctx in self._http_context_set.values():
+            ctx.reset()
 
         """Current http profile in use in the modem"""
         self._http_current_profile = 0xff
 
+    def _gnss_mirror_state_reset(self):
         """GNSS fix waiters"""
         self._gnss_fix_lock = uasyncio.Lock()
         self._gnss_fix_waiters = []
 
+    def _mqtt_mirror_state_reset(self):
+        _mqtt_topic_cache.clear()
+
         """Status of the MQTT connection"""
         self._mqtt_status = _walter.ModemMqttState.DISCONNECTED
 
-        """Inbox for MQTT messages"""
-        self._mqtt_messages = []
+        """MQTT messages announced by the modem, payload not yet downloaded"""
+        self._mqtt_pending = deque((), WALTER_MODEM_MQTT_MAX_PENDING_MSGS)
+
+        """MQTT messages of which the payload has been downloaded"""
+        self._mqtt_received = deque((), WALTER_MODEM_MQTT_MAX_PENDING_MSGS)
+
+        """The (topic, qos) subscribed to since the broker connection was made"""
+        self._mqtt_subscriptions = set()
+
+        """The (message_id, topic) of the pending messages with qos > 0"""
+        self._mqtt_pending_ids = set()
+
+        """Interned MQTT topics, see _mqtt_intern_topic"""
+        self._mqtt_topic_pool = {}
+
+    """
+    The functions resetting the mirror state of each subsystem, in the order
+    in which they are run.
+    """
+    _MIRROR_STATE_RESETS = (
+        _core_mirror_state_reset,
+        _pdp_mirror_state_reset,
+        _socket_mirror_state_reset,
+        _http_mirror_state_reset,
+        _gnss_mirror_state_reset,
+        _mqtt_mirror_state_reset,
+    )
+
+    def _mirror_state_reset(self):
+        """Reset the state mirroring the modem to its power-on values."""
+        for reset in self._MIRROR_STATE_RESETS:
+            reset(self)
+
+    def _http_ctx(self, profile_id):
+        """Get the http context of a profile, allocating it on first use.
+
+        :param profile_id: The id of the http profile.
+
+        :returns: The ModemHttpContext of the profile.
+        """
+        ctx = self._http_context_set.get(profile_id)
+        if ctx is None:
+            ctx = _walter.ModemHttpContext()
+            self._http_context_set[profile_id] = ctx
+
+        return ctx
+
+    def _pdp_ctx_get(self, context_id):
+        """Get a PDP context by id.
+
+        :param context_id: The id of the PDP context, -1 for the context that
+        was last used.
+
+        :returns: The ModemPDPContext or None when there is no such context.
+        """
+        if context_id == -1:
+            return self._pdp_ctx
+
+        # an explicit range check, a negative index would silently select a
+        # context from the end of the list; context ids start at 1 so None
+        # and 0 do not name a context
+        if context_id is not None and 1 <= context_id <= WALTER_MODEM_MAX_PDP_CTXTS:
+            return self._pdp_ctx_set[context_id - 1]
+
+        return None
+
+    def _socket_get(self, socket_id):
+        """Get a socket by id.
+
+        :param socket_id: The id of the socket, -1 for the socket that was
+        last used.
+
+        :returns: The ModemSocket or None when there is no such socket.
+        """
+        if socket_id == -1:
+            return self._socket
+
+        if 0 < socket_id <= WALTER_MODEM_MAX_SOCKETS:
+            return self._socket_set[socket_id - 1]
+
+        return None
+
+    def _mqtt_intern_topic(self, topic):
+        """Get the single shared instance of an MQTT topic string.
+
+        The messages of a topic then all refer to the string that was passed
+        to mqtt_subscribe instead of each holding its own copy, and comparing
+        them is an identity check. Once _MQTT_TOPIC_POOL_SIZE topics are
+        interned, new topics are returned as is.
+
+        :param topic: The topic string.
+
+        :returns: The interned topic string.
+        """
+        pool = self._mqtt_topic_pool
+        interned = pool.get(topic)
+        if interned is None:
+            if len(pool) >= _MQTT_TOPIC_POOL_SIZE:
+                return topic
+            interned = pool[topic] = topic
+
+        return interned
 
     async def _queue_rx_buffer(self):
         """Copy the currently received data buffer into the task queue.
@@ -283,11 +583,11 @@ class Modem:
         :returns: None.
         """
         qitem = _walter.ModemTaskQueueItem()
-        qitem.rsp = self._parser_data.line
+        qitem.rsp = bytes(self._parser_data.line)
 
         await self._task_queue.put(qitem)
 
-        self._parser_data.line = b''
+        self._parser_data.line = bytearray()
 
     def _add_at_byte_to_buffer(self, data, raw_mode_active):
         """Handle an AT data byte.
@@ -305,105 +605,113 @@ class Modem:
             self._parser_data.state = _walter.ModemRspParserState.END_LF
             return
 
-        self._parser_data.line += chr(data)
+        self._parser_data.line.append(data)
 
     async def _uart_reader(self):
         rx_stream = uasyncio.StreamReader(self._uart, {})
 
+        # bound once, these are used for every received byte
+        parser = self._parser_data
+        ParserState = _walter.ModemRspParserState
+        add_at_byte_to_buffer = self._add_at_byte_to_buffer
+
+        # the parser copies every byte it keeps, so one buffer serves all reads
+        incoming_uart_data = bytearray(256)
+        incoming_uart_view = memoryview(incoming_uart_data)
+
         while True:
-            incoming_uart_data = bytearray(256)
             size = await rx_stream.readinto(incoming_uart_data)
             print('RX:[%s]' % incoming_uart_data[:size])
-            for b in incoming_uart_data[:size]:
-                if self._parser_data.state == _walter.ModemRspParserState.START_CR:
+            for b in incoming_uart_view[:size]:
+                if parser.state == ParserState.START_CR:
                     if b == CR:
-                        self._parser_data.state = _walter.ModemRspParserState.START_LF
+                        parser.state = ParserState.START_LF
                     elif b == PLUS:
                         # This is the start of a new line in a multiline response
-                        self._parser_data.state = _walter.ModemRspParserState.DATA
-                        self._add_at_byte_to_buffer(b, False)
+                        parser.state = ParserState.DATA
+                        add_at_byte_to_buffer(b, False)
                 
-                elif self._parser_data.state == _walter.ModemRspParserState.START_LF:
+                elif parser.state == ParserState.START_LF:
                     if b == LF:
-                        self._parser_data.state = _walter.ModemRspParserState.DATA
+                        parser.state = ParserState.DATA
                 
-                elif self._parser_data.state == _walter.ModemRspParserState.DATA:
+                elif parser.state == ParserState.DATA:
                     if b == GREATER_THAN:
-                        self._parser_data.state = _walter.ModemRspParserState.DATA_PROMPT
+                        parser.state = ParserState.DATA_PROMPT
                     elif b == SMALLER_THAN:
-                        self._parser_data.state = _walter.ModemRspParserState.DATA_HTTP_START1
+                        parser.state = ParserState.DATA_HTTP_START1
                 
-                    self._add_at_byte_to_buffer(b, False)
+                    add_at_byte_to_buffer(b, False)
                     
-                elif self._parser_data.state == _walter.ModemRspParserState.DATA_PROMPT:
-                    self._add_at_byte_to_buffer(b, False)
+                elif parser.state == ParserState.DATA_PROMPT:
+                    add_at_byte_to_buffer(b, False)
                     if b == SPACE:
-                        self._parser_data.state = _walter.ModemRspParserState.START_CR
+                        parser.state = ParserState.START_CR
                         await self._queue_rx_buffer()
                     elif b == GREATER_THAN:
-                        self._parser_data.state = _walter.ModemRspParserState.DATA_PROMPT_HTTP
+                        parser.state = ParserState.DATA_PROMPT_HTTP
                     else:
                         # state might have changed after detecting end \r
-                        if self._parser_data.state == _walter.ModemRspParserState.DATA_PROMPT:
-                            self._parser_data.state = _walter.ModemRspParserState.DATA
+                        if parser.state == ParserState.DATA_PROMPT:
+                            parser.state = ParserState.DATA
                 
-                elif self._parser_data.state == _walter.ModemRspParserState.DATA_PROMPT_HTTP:
-                    self._add_at_byte_to_buffer(b, False)
+                elif parser.state == ParserState.DATA_PROMPT_HTTP:
+                    add_at_byte_to_buffer(b, False)
                     if b == GREATER_THAN:
-                        self._parser_data.state = _walter.ModemRspParserState.START_CR
+                        parser.state = ParserState.START_CR
                         await self._queue_rx_buffer()
                     else:
                         # state might have changed after detecting end \r
-                        if self._parser_data.state == _walter.ModemRspParserState.DATA_PROMPT_HTTP:
-                            self._parser_data.state = _walter.ModemRspParserState.DATA
+                        if parser.state == ParserState.DATA_PROMPT_HTTP:
+                            parser.state = ParserState.DATA
 
-                elif self._parser_data.state == _walter.ModemRspParserState.DATA_HTTP_START1:
+                elif parser.state == ParserState.DATA_HTTP_START1:
                     if b == SMALLER_THAN:
-                        self._parser_data.state = _walter.ModemRspParserState.DATA_HTTP_START2
+                        parser.state = ParserState.DATA_HTTP_START2
                     else:
-                        self._parser_data.state = _walter.ModemRspParserState.DATA
+                        parser.state = ParserState.DATA
 
-                    self._add_at_byte_to_buffer(b, False)
+                    add_at_byte_to_buffer(b, False)
 
-                elif self._parser_data.state == _walter.ModemRspParserState.DATA_HTTP_START2:
+                elif parser.state == ParserState.DATA_HTTP_START2:
                     if b == SMALLER_THAN and self._http_current_profile < WALTER_MODEM_MAX_HTTP_PROFILES:
                         # FIXME: modem might block longer than cmd timeout,
                         # will lead to retry, error etc - fix properly
-                        self._parser_data.raw_chunk_size = self._http_context_set[self._http_current_profile].content_length + len("\r\nOK\r\n")
-                        self._parser_data.state = _walter.ModemRspParserState.RAW
+                        parser.raw_chunk_size = self._http_ctx(self._http_current_profile).content_length + _LEN_HTTP_TAIL
+                        parser.state = ParserState.RAW
                     else:
-                        self._parser_data.state = _walter.ModemRspParserState.DATA
+                        parser.state = ParserState.DATA
 
-                    self._add_at_byte_to_buffer(b, False)
+                    add_at_byte_to_buffer(b, False)
 
-                elif self._parser_data.state == _walter.ModemRspParserState.END_LF:
+                elif parser.state == ParserState.END_LF:
                     if b == LF:
                         chunk_size = 0 ### FIXME
                         #uint16_t chunkSize = _extractRawBufferChunkSize();
                         if chunk_size:
-                            self._parser_data.raw_chunk_size = chunk_size
-                            self._parser_data.line += b'\r'
-                            self._parser_data.state = _walter.ModemRspParserState.RAW
+                            parser.raw_chunk_size = chunk_size
+                            parser.line.append(CR)
+                            parser.state = ParserState.RAW
                         else:
-                            self._parser_data.state = _walter.ModemRspParserState.START_CR
+                            parser.state = ParserState.START_CR
                             await self._queue_rx_buffer()
                     else:
                         # only now we know the \r was thrown away for no good reason
-                        self._parser_data.line += b'\r'
+                        parser.line.append(CR)
 
                         # next byte gets the same treatment; since we really are
                         # back in semi DATA state, as we now know
                         # (but > will not lead to data prompt mode)
-                        self._add_at_byte_to_buffer(b, False)
+                        add_at_byte_to_buffer(b, False)
                         if b != CR:
-                            self._parser_data.state = _walter.ModemRspParserState.DATA
+                            parser.state = ParserState.DATA
 
-                elif self._parser_data.state == _walter.ModemRspParserState.RAW:
-                    self._add_at_byte_to_buffer(b, True)
-                    self._parser_data.raw_chunk_size -= 1
+                elif parser.state == ParserState.RAW:
+                    add_at_byte_to_buffer(b, True)
+                    parser.raw_chunk_size -= 1
 
-                    if self._parser_data.raw_chunk_size == 0:
-                        self._parser_data.state = _walter.ModemRspParserState.START_CR
+                    if parser.raw_chunk_size == 0:
+                        parser.state = ParserState.START_CR
                         await self._queue_rx_buffer()
 
     async def _finish_queue_cmd(self, cmd, result):
@@ -474,260 +782,459 @@ class Modem:
                 else:
                     return
 
-    async def _process_queue_rsp(self, tx_stream, cmd, at_rsp):
-        """
-        Process an AT response from the queue.
+    """
+    The HTTP ring and <<< handlers run for every HTTP answer. They bind the
+    builtins and enum members they use as default arguments, which turns
+    the global and attribute lookups into local loads. Callers only ever
+    pass (cmd, at_rsp).
+    """
+    def _handle_http_rcv_answer_start(self, cmd, at_rsp,
+            _OK=_walter.ModemState.OK, _ERROR=_walter.ModemState.ERROR,
+            _GOT_RING=_walter.ModemHttpContextState.GOT_RING,
+            _HTTP_RESPONSE=_walter.ModemRspType.HTTP_RESPONSE):
+        if self._http_current_profile >= WALTER_MODEM_MAX_HTTP_PROFILES:
+            return _ERROR
+
+        ctx = self._http_ctx(self._http_current_profile)
+        if ctx.state != _GOT_RING:
+            return _ERROR
+
+        if not cmd:
+            return None
+
+        rsp = cmd.rsp
+        rsp.type = _HTTP_RESPONSE
+        http_response = rsp.http_response = ctx.response
+        http_response.reset()
+        http_response.http_status = ctx.http_status
+        http_response.data = memoryview(at_rsp)[3:ctx.content_length + 3]   # skip <<<
+        http_response.content_type = ctx.content_type
+
+        # the complete handler will reset the state,
+        # even if we never received <<< but got an error instead
+        return _OK
+
+    def _handle_http_ring(self, cmd, at_rsp, _int=int,
+            _OK=_walter.ModemState.OK,
+            _EXPECT_RING=_walter.ModemHttpContextState.EXPECT_RING,
+            _GOT_RING=_walter.ModemHttpContextState.GOT_RING):
+        parts = at_rsp[_LEN_HTTP_RING:].split(b',', 3)
+        profile_id = _int(parts[0])
 
-        This function is called in the queue processing task when an AT
-        response is received from the modem. The function will process the
-        response and notify blocked functions or call the correct callbacks.
+        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+            # TODO: return error if modem returns invalid profile id.
+            # problem: this message is an URC: the associated cmd
+            # may be any random command currently executing */
+            return None
 
-        :param cmd: The pending command or None when no command is pending.
-        :param at_rsp: The AT response.
+        # TODO: if not expecting a ring, it may be a bug in the modem
+        # or at our side and we should report an error + read the
+        # content to free the modem buffer
+        # (knowing that this is a URC so there is no command
+        # to give feedback to)
+        ctx = self._http_ctx(profile_id)
+        if ctx.state != _EXPECT_RING:
+            return None
 
-        :return: None.
-        """
-        
-        result = _walter.ModemState.OK
+        # remember ring info
+        ctx.state = _GOT_RING
+        ctx.http_status = _int(parts[1])
+        ctx.content_type = parts[2].decode()
+        ctx.content_length = _int(parts[3])
 
-        if at_rsp.startswith("+CEREG: "):
-            ce_reg = int(at_rsp.decode().split(':')[1].split(',')[0])
-            self._reg_state = ce_reg
-            # TODO: call correct handlers (also still todo in arduino version)
+        return _OK
 
-        elif at_rsp.startswith("> ") or at_rsp.startswith(">>>"):
-            if cmd and cmd.data and cmd.type == _walter.ModemCmdType.DATA_TX_WAIT:
-                print('TX:[%s]' % cmd.data)
-                tx_stream.write(cmd.data)
-                await tx_stream.drain()
+    def _handle_http_connect(self, cmd, at_rsp):
+        profile_id_str, result_code_str = at_rsp[_LEN_HTTP_CONNECT:].split(b',', 1)
+        profile_id = int(profile_id_str)
 
-        elif at_rsp.startswith("ERROR"):
-            if cmd is not None:
-                cmd.rsp.type = _walter.ModemRspType.NO_DATA
-                cmd.state = _walter.ModemCmdState.RETRY_AFTER_ERROR
-            return
+        if profile_id < WALTER_MODEM_MAX_HTTP_PROFILES:
+            self._http_ctx(profile_id).connected = int(result_code_str) == 0
 
-        elif at_rsp.startswith("+CME ERROR: "):
-            if cmd is not None:
-                cme_error = int(at_rsp.decode().split(':')[1].split(',')[0])
-                cmd.rsp.type = _walter.ModemRspType.CME_ERROR
-                cmd.rsp.cme_error = cme_error
-                cmd.state = _walter.ModemCmdState.RETRY_AFTER_ERROR
-            return
+        return _walter.ModemState.OK
 
-        elif at_rsp.startswith("+CFUN: "):
-            op_state = int(at_rsp.decode().split(':')[1].split(',')[0])
-            self._op_state = op_state
+    def _handle_http_disconnect(self, cmd, at_rsp):
+        profile_id = int(at_rsp[_LEN_HTTP_DISCONNECT:])
 
-            if cmd is None:
-                return
+        if profile_id < WALTER_MODEM_MAX_HTTP_PROFILES:
+            self._http_ctx(profile_id).connected = False
 
-            cmd.rsp.type = _walter.ModemRspType.OP_STATE
-            cmd.rsp.op_state = self._op_state
+        return _walter.ModemState.OK
 
-        elif at_rsp.startswith("+SQNMODEACTIVE: "):
-            if cmd is None:
-                return
+    def _handle_http_sh(self, cmd, at_rsp):
+        profile_id = int(at_rsp[_LEN_HTTP_SH:].split(b',', 1)[0])
 
-            cmd.rsp.type = _walter.ModemRspType.RAT
-            cmd.rsp.rat = int(at_rsp.decode().split(':')[1]) - 1
+        if profile_id < WALTER_MODEM_MAX_HTTP_PROFILES:
+            self._http_ctx(profile_id).connected = False
 
-        elif at_rsp.startswith("+SQNBANDSEL: "):
-            data = at_rsp[len('+SQNBANDSEL: '):]
+        return _walter.ModemState.OK
 
-            # create the array and response type upon reception of the
-            # first band selection
-            if cmd.rsp.type != _walter.ModemRspType.BANDSET_CFG_SET:
-                cmd.rsp.type = _walter.ModemRspType.BANDSET_CFG_SET
-                cmd.rsp.band_sel_cfg_set = []
+    def _handle_mqtt_on_connect(self, cmd, at_rsp):
+        if at_rsp.startswith(b'+SQNSMQTTONCONNECT:0,'):
+            # every connect starts a new session, possibly with another
+            # broker, the subscriptions of the previous one are gone
+            self._mqtt_subscriptions.clear()
+            if int(at_rsp[at_rsp.rfind(b',') + 1:]):
+                self._mqtt_status = _walter.ModemMqttState.DISCONNECTED
+            else:
+                self._mqtt_status = _walter.ModemMqttState.CONNECTED
 
-            bsel = _walter.ModemBandSelection()
+        return _walter.ModemState.OK
 
-            if data[0] == ord('0'):
-                bsel.rat = _walter.ModemRat.LTEM
-            else:
-                bsel.rat = _walter.ModemRat.NBIOT;
-
-            # Parse operator name
-            bsel.net_operator.format = _walter.ModemOperatorFormat.LONG_ALPHANUMERIC
-            bsel_parts = data[2:].decode().split(',')
-            bsel.net_operator.name = bsel_parts[0]
-
-            # Parse configured bands
-            bands_list = bsel_parts[1:]
-            if len(bands_list) > 1:
-                bands_list[0] = bands_list[0][1:]
-                bands_list[-1] = bands_list[-1][:-1]
-                bsel.bands = [ int(x) for x in bands_list ]
-            elif bands_list[0] != '""':
-                bsel.bands = [ int(bands_list[0][1:-1]) ]
-            else:
-                bsel.bands = []
+    def _handle_mqtt_on_disconnect(self, cmd, at_rsp):
+        if at_rsp.startswith(b'+SQNSMQTTONDISCONNECT:0,'):
+            result_code = int(at_rsp[at_rsp.rfind(b',') + 1:])
 
-            cmd.rsp.band_sel_cfg_set.append(bsel)
+            # TODO: handle error message when resultcode != 0
+            self._mqtt_status = _walter.ModemMqttState.DISCONNECTED
+            self._mqtt_subscriptions.clear()
+
+        return _walter.ModemState.OK
+
+    def _handle_mqtt_on_message(self, cmd, at_rsp):
+        if not at_rsp.startswith(b'+SQNSMQTTONMESSAGE:0,'):
+            return _walter.ModemState.OK
+
+        parts = at_rsp[_LEN_MQTT_ONMESSAGE:].split(b',', 4)
+        topic = parts[1]
+        if topic[:1] == b'"':
+            topic = topic[1:-1]
+        topic = self._mqtt_intern_topic(topic.decode())
+        length = int(parts[2])
+        qos = int(parts[3])
+        if qos != 0 and len(parts) > 4:
+            message_id = parts[4].decode()
+        else:
+            message_id = None
+
+        # the modem announces a qos > 0 message again when it is
+        # redelivered, it must only be downloaded once
+        pending_ids = self._mqtt_pending_ids
+        if message_id is None or (message_id, topic) not in pending_ids:
+            if message_id is not None:
+                pending_ids.add((message_id, topic))
+
+            pending = self._mqtt_pending
+            if len(pending) == WALTER_MODEM_MQTT_MAX_PENDING_MSGS:
+                print('MQTT inbox full, dropping the oldest message.')
+                dropped = pending.popleft()
+                pending_ids.discard((dropped.message_id, dropped.topic))
+            pending.append(_walter.ModemMqttMessage(topic, length, qos, message_id))
+
+        return _walter.ModemState.OK
+
+    def _handle_cereg(self, cmd, at_rsp):
+        ce_reg = int(at_rsp[_LEN_CEREG:].split(b',', 1)[0])
+        self._reg_state = ce_reg
+        # TODO: call correct handlers (also still todo in arduino version)
+
+        return _walter.ModemState.OK
+
+    def _handle_cme_error(self, cmd, at_rsp):
+        if cmd is not None:
+            cme_error = int(at_rsp[_LEN_CME_ERROR:].split(b',', 1)[0])
+            cmd.rsp.type = _walter.ModemRspType.CME_ERROR
+            cmd.rsp.cme_error = cme_error
+            cmd.state = _walter.ModemCmdState.RETRY_AFTER_ERROR
+        return None
 
-        elif at_rsp.startswith("+CPIN: "):
-            if cmd is None:
-                return
+    def _handle_cfun(self, cmd, at_rsp):
+        op_state = int(at_rsp[_LEN_CFUN:].split(b',', 1)[0])
+        self._op_state = op_state
+        self._op_state_known = True
 
-            cmd.rsp.type = _walter.ModemRspType.SIM_STATE
-            if at_rsp[len('+CPIN: '):] == b'READY':
-                cmd.rsp.sim_state = _walter.ModemSimState.READY
-            elif at_rsp[len('+CPIN: '):] == b"SIM PIN":
-                cmd.rsp.sim_state = _walter.ModemSimState.PIN_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"SIM PUK":
-                cmd.rsp.sim_state = _walter.ModemSimState.PUK_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-SIM PIN":
-                cmd.rsp.sim_state = _walter.ModemSimState.PHONE_TO_SIM_PIN_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-FSIM PIN":
-                cmd.rsp.sim_state = _walter.ModemSimState.PHONE_TO_FIRST_SIM_PIN_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-FSIM PUK":
-                cmd.rsp.sim_state = _walter.ModemSimState.PHONE_TO_FIRST_SIM_PUK_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"SIM PIN2":
-                cmd.rsp.sim_state = _walter.ModemSimState.PIN2_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"SIM PUK2":
-                cmd.rsp.sim_state = _walter.ModemSimState.PUK2_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-NET PIN":
-                cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_PIN_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-NET PUK":
-                cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_PUK_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-NETSUB PIN":
-                cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_SUBSET_PIN_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-NETSUB PUK":
-                cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_SUBSET_PUK_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-SP PIN":
-                cmd.rsp.sim_state = _walter.ModemSimState.SERVICE_PROVIDER_PIN_REQUIRED
-            elif at_rsp[len('+CPIN: '):] == b"PH-SP PUK":
-                cmd.rsp.sim_state = _walter.ModemSimState.SERVICE_PROVIDER_PUK_REQUIRED 
-            elif at_rsp[len('+CPIN: '):] == b"PH-CORP PIN":
-                cmd.rsp.sim_state = _walter.ModemSimState.CORPORATE_SIM_REQUIRED 
-            elif at_rsp[len('+CPIN: '):] == b"PH-CORP PUK":
-                cmd.rsp.sim_state = _walter.ModemSimState.CORPORATE_PUK_REQUIRED 
-            else:
-                cmd.rsp.type = _walter.ModemRspType.NO_DATA
+        if cmd is None:
+            return None
 
-        elif at_rsp.startswith("+CGPADDR: "):
-            if not cmd:
-                return
+        cmd.rsp.type = _walter.ModemRspType.OP_STATE
+        cmd.rsp.op_state = self._op_state
 
-            cmd.rsp.type = _walter.ModemRspType.PDP_ADDR 
-            cmd.rsp.pdp_address_list = []
+        return _walter.ModemState.OK
 
-            parts = at_rsp.decode().split(',')
-            
-            context_id = int(parts[0][len('+CGPADDR: '):])
-            if len(parts) > 1 and parts[1]:
-                cmd.rsp.pdp_address_list.append(parts[1][1:-1])
-            if len(parts) > 2 and parts[2]:
-                cmd.rsp.pdp_address_list.append(parts[2][1:-1])
+    def _handle_sqnmodeactive(self, cmd, at_rsp):
+        if cmd is None:
+            return None
 
-        elif at_rsp.startswith("+CSQ: "):
-            if not cmd:
-                return
+        cmd.rsp.type = _walter.ModemRspType.RAT
+        cmd.rsp.rat = int(at_rsp[_LEN_SQNMODEACTIVE:]) - 1
 
-            parts = at_rsp.decode().split(',')
-            raw_rssi = int(parts[0][len('+CSQ: '):])
+        return _walter.ModemState.OK
 
-            cmd.rsp.type = _walter.ModemRspType.RSSI
-            cmd.rsp.rssi = -113 + (raw_rssi * 2)
+    def _handle_sqnbandsel(self, cmd, at_rsp):
+        data = at_rsp[_LEN_SQNBANDSEL:]
 
-        elif at_rsp.startswith("+CESQ: "):
-            if not cmd:
-                return
+        # create the array and response type upon reception of the
+        # first band selection
+        if cmd.rsp.type != _walter.ModemRspType.BANDSET_CFG_SET:
+            cmd.rsp.type = _walter.ModemRspType.BANDSET_CFG_SET
+            cmd.rsp.band_sel_cfg_set = []
 
-            cmd.rsp.type = _walter.ModemRspType.SIGNAL_QUALITY
+        bsel = _walter.ModemBandSelection()
 
-            parts = at_rsp.decode().split(',')
-            cmd.rsp.signal_quality = _walter.ModemSignalQuality()
-            cmd.rsp.signal_quality.rsrq = -195 + (int(parts[4]) * 5)
-            cmd.rsp.signal_quality.rsrp = -140 + int(parts[5])
+        if data[0] == ord('0'):
+            bsel.rat = _walter.ModemRat.LTEM
+        else:
+            bsel.rat = _walter.ModemRat.NBIOT;
+
+        # Parse operator name
+        bsel.net_operator.format = _walter.ModemOperatorFormat.LONG_ALPHANUMERIC
+        bsel_parts = data[2:].decode().split(',')
+        bsel.net_operator.name = bsel_parts[0]
+
+        # Parse configured bands
+        bands_list = bsel_parts[1:]
+        if len(bands_list) > 1:
+            bands_list[0] = bands_list[0][1:]
+            bands_list[-1] = bands_list[-1][:-1]
+            bsel.bands = [ int(x) for x in bands_list ]
+        elif bands_list[0] != '""':
+            bsel.bands = [ int(bands_list[0][1:-1]) ]
+        else:
+            bsel.bands = []
+
+        cmd.rsp.band_sel_cfg_set.append(bsel)
+
+        return _walter.ModemState.OK
+
+    def _handle_cpin(self, cmd, at_rsp):
+        if cmd is None:
+            return None
+
+        cmd.rsp.type = _walter.ModemRspType.SIM_STATE
+        sim_state = at_rsp[_LEN_CPIN:]
+        if sim_state == b'READY':
+            cmd.rsp.sim_state = _walter.ModemSimState.READY
+        elif sim_state == b"SIM PIN":
+            cmd.rsp.sim_state = _walter.ModemSimState.PIN_REQUIRED
+        elif sim_state == b"SIM PUK":
+            cmd.rsp.sim_state = _walter.ModemSimState.PUK_REQUIRED
+        elif sim_state == b"PH-SIM PIN":
+            cmd.rsp.sim_state = _walter.ModemSimState.PHONE_TO_SIM_PIN_REQUIRED
+        elif sim_state == b"PH-FSIM PIN":
+            cmd.rsp.sim_state = _walter.ModemSimState.PHONE_TO_FIRST_SIM_PIN_REQUIRED
+        elif sim_state == b"PH-FSIM PUK":
+            cmd.rsp.sim_state = _walter.ModemSimState.PHONE_TO_FIRST_SIM_PUK_REQUIRED
+        elif sim_state == b"SIM PIN2":
+            cmd.rsp.sim_state = _walter.ModemSimState.PIN2_REQUIRED
+        elif sim_state == b"SIM PUK2":
+            cmd.rsp.sim_state = _walter.ModemSimState.PUK2_REQUIRED
+        elif sim_state == b"PH-NET PIN":
+            cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_PIN_REQUIRED
+        elif sim_state == b"PH-NET PUK":
+            cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_PUK_REQUIRED
+        elif sim_state == b"PH-NETSUB PIN":
+            cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_SUBSET_PIN_REQUIRED
+        elif sim_state == b"PH-NETSUB PUK":
+            cmd.rsp.sim_state = _walter.ModemSimState.NETWORK_SUBSET_PUK_REQUIRED
+        elif sim_state == b"PH-SP PIN":
+            cmd.rsp.sim_state = _walter.ModemSimState.SERVICE_PROVIDER_PIN_REQUIRED
+        elif sim_state == b"PH-SP PUK":
+            cmd.rsp.sim_state = _walter.ModemSimState.SERVICE_PROVIDER_PUK_REQUIRED 
+        elif sim_state == b"PH-CORP PIN":
+            cmd.rsp.sim_state = _walter.ModemSimState.CORPORATE_SIM_REQUIRED 
+        elif sim_state == b"PH-CORP PUK":
+            cmd.rsp.sim_state = _walter.ModemSimState.CORPORATE_PUK_REQUIRED 
+        else:
+            cmd.rsp.type = _walter.ModemRspType.NO_DATA
 
-        elif at_rsp.startswith("+CCLK: "):
-            if not cmd:
-                return
+        return _walter.ModemState.OK
 
-            cmd.rsp.type = _walter.ModemRspType.CLOCK
-            time_str = at_rsp[len('+CCLK: '):].decode()[1:-1]   # strip double quotes
-            cmd.rsp.clock = parse_cclk_time(time_str)
+    def _handle_cgpaddr(self, cmd, at_rsp):
+        if not cmd:
+            return None
 
-        elif at_rsp.startswith("<<<"):      # <<< is start of SQNHTTPRCV answer
-            if self._http_current_profile >= WALTER_MODEM_MAX_HTTP_PROFILES or self._http_context_set[self._http_current_profile].state != _walter.ModemHttpContextState.GOT_RING:
-                result = _walter.ModemState.ERROR
-            else:
-                if not cmd:
-                    return
+        cmd.rsp.type = _walter.ModemRspType.PDP_ADDR 
+        cmd.rsp.pdp_address_list = []
 
-                cmd.rsp.type = _walter.ModemRspType.HTTP_RESPONSE
-                cmd.rsp.http_response = _walter.ModemHttpResponse()
-                cmd.rsp.http_response.http_status = self._http_context_set[self._http_current_profile].http_status
-                cmd.rsp.http_response.data = at_rsp[3:self._http_context_set[self._http_current_profile].content_length + 3]         # skip <<<
-                cmd.rsp.http_response.content_type = self._http_context_set[self._http_current_profile].content_type
-
-                # the complete handler will reset the state,
-                # even if we never received <<< but got an error instead
-
-        elif at_rsp.startswith("+SQNHTTPRING: "):
-            profile_id_str, http_status_str, content_type, content_length_str = at_rsp[len("+SQNHTTPRING: "):].decode().split(',')
-            profile_id = int(profile_id_str)
-            http_status = int(http_status_str)
-            content_length = int(content_length_str)
-
-            if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
-                # TODO: return error if modem returns invalid profile id.
-                # problem: this message is an URC: the associated cmd
-                # may be any random command currently executing */
-                return
+        parts = at_rsp.decode().split(',')
+        
+        context_id = int(parts[0][_LEN_CGPADDR:])
+        if len(parts) > 1 and parts[1]:
+            cmd.rsp.pdp_address_list.append(parts[1][1:-1])
+        if len(parts) > 2 and parts[2]:
+            cmd.rsp.pdp_address_list.append(parts[2][1:-1])
 
-            # TODO: if not expecting a ring, it may be a bug in the modem
-            # or at our side and we should report an error + read the
-            # content to free the modem buffer
-            # (knowing that this is a URC so there is no command
-            # to give feedback to)
-            if self._http_context_set[profile_id].state != _walter.ModemHttpContextState.EXPECT_RING:
-                return
+        return _walter.ModemState.OK
 
-            # remember ring info
-            self._http_context_set[profile_id].state = _walter.ModemHttpContextState.GOT_RING
-            self._http_context_set[profile_id].http_status = http_status
-            self._http_context_set[profile_id].content_type = content_type
-            self._http_context_set[profile_id].content_length = content_length
+    def _handle_csq(self, cmd, at_rsp):
+        if not cmd:
+            return None
 
-        elif at_rsp.startswith("+SQNHTTPCONNECT: "):
-            profile_id_str, result_code_str = at_rsp[len("+SQNHTTPCONNECT: "):].decode().split(',')
-            profile_id = int(profile_id_str)
-            result_code = int(result_code_str)
+        parts = at_rsp.decode().split(',')
+        raw_rssi = int(parts[0][_LEN_CSQ:])
 
-            if profile_id < WALTER_MODEM_MAX_HTTP_PROFILES:
-                if result_code == 0:
-                    self._http_context_set[profile_id].connected = True
-                else:
-                    self._http_context_set[profile_id].connected = False
+        cmd.rsp.type = _walter.ModemRspType.RSSI
+        cmd.rsp.rssi = -113 + (raw_rssi * 2)
+
+        return _walter.ModemState.OK
+
+    def _handle_cesq(self, cmd, at_rsp):
+        if not cmd:
+            return None
+
+        cmd.rsp.type = _walter.ModemRspType.SIGNAL_QUALITY
+
+        parts = at_rsp.decode().split(',')
+        cmd.rsp.signal_quality = _walter.ModemSignalQuality()
+        cmd.rsp.signal_quality.rsrq = -195 + (int(parts[4]) * 5)
+        cmd.rsp.signal_quality.rsrp = -140 + int(parts[5])
+
+        return _walter.ModemState.OK
+
+    def _handle_cclk(self, cmd, at_rsp):
+        if not cmd:
+            return None
+
+        cmd.rsp.type = _walter.ModemRspType.CLOCK
+        time_str = at_rsp[_LEN_CCLK:].decode()[1:-1]   # strip double quotes
+        cmd.rsp.clock = parse_cclk_time(time_str)
+
+        return _walter.ModemState.OK
+
+    def _handle_sqnsh(self, cmd, at_rsp):
+        socket_id = int(at_rsp[_LEN_SQNSH:])
+        if not 0 < socket_id <= WALTER_MODEM_MAX_SOCKETS:
+            return None
+
+        _socket = self._socket_set[socket_id - 1]
+
+        self._socket = _socket
+        _socket.state = _walter.ModemSocketState.FREE
+
+        return _walter.ModemState.OK
+
+    def _handle_gnss_assistance(self, cmd, at_rsp):
+        if not cmd:
+            return None
+
+        if cmd.rsp.type != _walter.ModemRspType.GNSS_ASSISTANCE_DATA:
+            cmd.rsp.type = _walter.ModemRspType.GNSS_ASSISTANCE_DATA
+            cmd.rsp.gnss_assistance = _walter.ModemGNSSAssistance()
+
+        data = at_rsp[_LEN_GNSS_ASSISTANCE:]
+        part_no = 0;
+        start_pos = 0
+        part = ''
+        gnss_details = None
+
+        for character_pos in range(len(data)):
+            character = data[character_pos]
+            part_complete = False
+
+            if character == ord(','):
+                part = data[start_pos:character_pos]
+                part_complete = True;
+            elif character_pos + 1 == len(data):
+                part = data[start_pos:character_pos + 1]
+                part_complete = True
+
+            if part_complete:
+                if part_no == 0:
+                    if part[0] == ord('0'):
+                        gnss_details = cmd.rsp.gnss_assistance.almanac
+                    elif part[0] == ord('1'):
+                        gnss_details = cmd.rsp.gnss_assistance.realtime_ephemeris
+                    elif part[0] == ord('2'):
+                        gnss_details = cmd.rsp.gnss_assistance.predicted_ephemeris
+                elif part_no == 1:
+                    if gnss_details:
+                        gnss_details.available = int(part) == 1
+                elif part_no == 2:
+                    if gnss_details:
+                        gnss_details.last_update = int(part)
+                elif part_no == 3:
+                    if gnss_details:
+                        gnss_details.time_to_update = int(part)
+                elif part_no == 4:
+                    if gnss_details:
+                        gnss_details.time_to_expire = int(part)
+
+                # +1 for the comma
+                part_no += 1;
+                start_pos = character_pos + 1
+                part = ''
+
+        return _walter.ModemState.OK
+
+    """
+    Response and URC handlers keyed on the response prefix up to and
+    including the colon. A handler returns the result to complete the pending
+    command with, or None when the response must not complete the pending
+    command. +LPGNSSFIXREADY stays in _process_queue_rsp because it has to
+    await the fix waiter lock.
+    """
+    _URC_HANDLERS = {
+        b'+SQNHTTPRING:': _handle_http_ring,
+        b'+SQNHTTPCONNECT:': _handle_http_connect,
+        b'+SQNHTTPDISCONNECT:': _handle_http_disconnect,
+        b'+SQNHTTPSH:': _handle_http_sh,
+        b'+SQNSMQTTONCONNECT:': _handle_mqtt_on_connect,
+        b'+SQNSMQTTONDISCONNECT:': _handle_mqtt_on_disconnect,
+        b'+SQNSMQTTONMESSAGE:': _handle_mqtt_on_message,
+        b'+CEREG:': _handle_cereg,
+        b'+CME ERROR:': _handle_cme_error,
+        b'+CFUN:': _handle_cfun,
+        b'+SQNMODEACTIVE:': _handle_sqnmodeactive,
+        b'+SQNBANDSEL:': _handle_sqnbandsel,
+        b'+CPIN:': _handle_cpin,
+        b'+CGPADDR:': _handle_cgpaddr,
+        b'+CSQ:': _handle_csq,
+        b'+CESQ:': _handle_cesq,
+        b'+CCLK:': _handle_cclk,
+        b'+SQNSH:': _handle_sqnsh,
+        b'+LPGNSSASSISTANCE:': _handle_gnss_assistance,
+    }
 
-        elif at_rsp.startswith("+SQNHTTPDISCONNECT: "):
-            profile_id = int(at_rsp[len("+SQNHTTPDISCONNECT: "):].decode())
+    """
+    Handlers of responses without a prefix ending in a colon, matched in
+    order on the start of the response when _URC_HANDLERS has no match.
+    """
+    _URC_FALLBACK_HANDLERS = (
+        (b'<<<', _handle_http_rcv_answer_start),    # start of SQNHTTPRCV answer
+    )
 
-            if profile_id < WALTER_MODEM_MAX_HTTP_PROFILES:
-                self._http_context_set[profile_id].connected = False
+    async def _process_queue_rsp(self, tx_stream, cmd, at_rsp):
+        """
+        Process an AT response from the queue.
 
-        elif at_rsp.startswith("+SQNHTTPSH: "):
-            profile_id_str, _ = at_rsp[len('+SQNHTTPSH: '):].decode().split(',')
-            profile_id = int(profile_id_str)
+        This function is called in the queue processing task when an AT
+        response is received from the modem. The function will process the
+        response and notify blocked functions or call the correct callbacks.
 
-            if profile_id < WALTER_MODEM_MAX_HTTP_PROFILES:
-                self._http_context_set[profile_id].connected = False
+        :param cmd: The pending command or None when no command is pending.
+        :param at_rsp: The AT response.
 
-        elif at_rsp.startswith("+SQNSH: "):
-            socket_id = int(at_rsp[len('+SQNSH: '):].decode())
-            try:
-                _socket = self._socket_set[socket_id - 1]
-            except:
+        :return: None.
+        """
+        
+        result = _walter.ModemState.OK
+
+        handler = self._URC_HANDLERS.get(at_rsp[:at_rsp.find(b':') + 1])
+        if not handler:
+            for prefix, fallback in self._URC_FALLBACK_HANDLERS:
+                if at_rsp.startswith(prefix):
+                    handler = fallback
+                    break
+
+        if handler:
+            result = handler(self, cmd, at_rsp)
+            if result is None:
                 return
 
-            self._socket = _socket
-            _socket.state = _walter.ModemSocketState.FREE
+        elif at_rsp.startswith("> ") or at_rsp.startswith(">>>"):
+            if cmd and cmd.data and cmd.type == _walter.ModemCmdType.DATA_TX_WAIT:
+                print('TX:[%s]' % cmd.data)
+                tx_stream.write(cmd.data)
+                await tx_stream.drain()
+
+        elif at_rsp.startswith("ERROR"):
+            if cmd is not None:
+                cmd.rsp.type = _walter.ModemRspType.NO_DATA
+                cmd.state = _walter.ModemCmdState.RETRY_AFTER_ERROR
+            return
 
         elif at_rsp.startswith("+LPGNSSFIXREADY: "):
-            data = at_rsp[len("+LPGNSSFIXREADY: "):]
+            data = at_rsp[_LEN_GNSS_FIX:]
 
             parenthesis_open = False
             part_no = 0;
@@ -805,85 +1312,7 @@ class Modem:
 
                 self._gnss_fix_waiters = []
 
-        elif at_rsp.startswith("+LPGNSSASSISTANCE: "):
-            if not cmd:
-                return
-
-            if cmd.rsp.type != _walter.ModemRspType.GNSS_ASSISTANCE_DATA:
-                cmd.rsp.type = _walter.ModemRspType.GNSS_ASSISTANCE_DATA
-                cmd.rsp.gnss_assistance = _walter.ModemGNSSAssistance()
-
-            data = at_rsp[len("+LPGNSSASSISTANCE: "):]
-            part_no = 0;
-            start_pos = 0
-            part = ''
-            gnss_details = None
-
-            for character_pos in range(len(data)):
-                character = data[character_pos]
-                part_complete = False
-
-                if character == ord(','):
-                    part = data[start_pos:character_pos]
-                    part_complete = True;
-                elif character_pos + 1 == len(data):
-                    part = data[start_pos:character_pos + 1]
-                    part_complete = True
-
-                if part_complete:
-                    if part_no == 0:
-                        if part[0] == ord('0'):
-                            gnss_details = cmd.rsp.gnss_assistance.almanac
-                        elif part[0] == ord('1'):
-                            gnss_details = cmd.rsp.gnss_assistance.realtime_ephemeris
-                        elif part[0] == ord('2'):
-                            gnss_details = cmd.rsp.gnss_assistance.predicted_ephemeris
-                    elif part_no == 1:
-                        if gnss_details:
-                            gnss_details.available = int(part) == 1
-                    elif part_no == 2:
-                        if gnss_details:
-                            gnss_details.last_update = int(part)
-                    elif part_no == 3:
-                        if gnss_details:
-                            gnss_details.time_to_update = int(part)
-                    elif part_no == 4:
-                        if gnss_details:
-                            gnss_details.time_to_expire = int(part)
-
-                    # +1 for the comma
-                    part_no += 1;
-                    start_pos = character_pos + 1
-                    part = ''
-
-        elif at_rsp.startswith("+SQNSMQTTONCONNECT:0,"):
-            _, result_code_str = at_rsp[len("+SQNSMQTTONCONNECT:"):].decode().split(',')
-            result_code = int(result_code_str)
-
-            if result_code:
-                self._mqtt_status = _walter.ModemMqttState.DISCONNECTED
-            else:
-                self._mqtt_status = _walter.ModemMqttState.CONNECTED
-        
-        elif at_rsp.startswith("+SQNSMQTTONDISCONNECT:0,"):
-            _, result_code_str = at_rsp[len("+SQNSMQTTONDISCONNECT:"):].decode().split(',')
-            result_code = int(result_code_str)
-
-            # TODO: handle error message when resultcode != 0
-            self._mqtt_status = _walter.ModemMqttState.DISCONNECTED
-
-        elif at_rsp.startswith("+SQNSMQTTONMESSAGE:0,"):
-            parts = at_rsp[len("+SQNSMQTTONMESSAGE:"):].decode().split(',')
-            topic = parts[1].replace('"', '')
-            length = int(parts[2])
-            qos = int(parts[3])
-            if qos != 0 and len(parts) > 4:
-                message_id = parts[4]
-            else:
-                message_id = None
-            self._mqtt_messages.append(_walter.ModemMqttMessage(topic, length, qos, message_id))
-
-        elif cmd and cmd.at_cmd.startswith("AT+SQNSMQTTRCVMESSAGE=0"):
+        elif cmd and cmd.collect_rsp_type == _walter.ModemRspType.MQTT:
             if cmd.rsp.type != _walter.ModemRspType.MQTT:
                 cmd.rsp.type = _walter.ModemRspType.MQTT
                 cmd.rsp.mqtt_data = at_rsp.decode()
@@ -931,9 +1360,11 @@ class Modem:
                 if cur_cmd.state == _walter.ModemCmdState.COMPLETE:
                     cur_cmd = None
 
-    async def _run_cmd(self, at_cmd, at_rsp, data,
-            complete_handler, complete_handler_arg,
-            cmd_type, max_attempts):
+    async def _run_cmd(self, at_cmd, at_rsp = b'OK', data = None,
+            complete_handler = None, complete_handler_arg = None,
+            cmd_type = _walter.ModemCmdType.TX_WAIT,
+            max_attempts = WALTER_MODEM_DEFAULT_CMD_ATTEMPTS,
+            rsp = None, collect_rsp_type = None):
         """Add a command to the command queue and await execution.
         
         This function add a command to the task queue. This function will 
@@ -950,6 +1381,10 @@ class Modem:
         :param complete_handler_arg: Optional argument for the complete handler.
         :param cmd_type: The type of queue AT command.
         :param max_attempts: The maximum number of retries for this command.
+        :param rsp: Optional response object to reset and reuse for this
+        command instead of allocating a new one.
+        :param collect_rsp_type: Optional response type to store a response
+        line that matches no handler as.
         
         :returns: Pointer to the command on success, NULL when no memory for
         the command was available.
@@ -958,8 +1393,13 @@ class Modem:
 
         cmd.at_cmd = at_cmd
         cmd.at_rsp = at_rsp
-        cmd.rsp = _walter.ModemRsp()
+        if rsp:
+            rsp.reset()
+            cmd.rsp = rsp
+        else:
+            cmd.rsp = _walter.ModemRsp()
         cmd.type = cmd_type
+        cmd.collect_rsp_type = collect_rsp_type
         cmd.data = data
         cmd.complete_handler = complete_handler
         cmd.complete_handler_arg = complete_handler_arg
@@ -976,6 +1416,64 @@ class Modem:
         await cmd.event.wait()
         return cmd.rsp
 
+    """
+    Whether the modem accepts AT commands chained with ';' on a single command
+    line, None as long as this has not been learned from the probe.
+    """
+    _at_chaining = None
+
+    async def _probe_at_chaining(self):
+        """Learn whether the modem accepts chained AT commands.
+
+        The probe chains two queries without side effects, so it can be
+        sent without the risk of running a command twice. Only a plain
+        ERROR, the answer to a command line the modem cannot parse, means
+        chaining is not supported. After a +CME ERROR or a timeout it is
+        still not known, the commands at hand run one by one and the next
+        chain probes again.
+
+        :returns: The response of the probe.
+        """
+        rsp = await self._run(_AT_CHAIN_PROBE, max_attempts=1)
+        if rsp.result == _walter.ModemState.OK:
+            self._at_chaining = True
+        elif rsp.result == _walter.ModemState.ERROR \
+                and rsp.type != _walter.ModemRspType.CME_ERROR:
+            self._at_chaining = False
+
+        return rsp
+
+    async def _run_cmd_chain(self, at_cmds, at_rsp, cmd_type):
+        """Run a sequence of AT commands in a single round trip.
+
+        The commands are chained on one command line when the modem accepts
+        this, see _probe_at_chaining. Otherwise, and as long as the probe
+        could not tell, they are run one by one, each with the usual
+        attempts like any single command. A chain is sent once: the modem
+        may have run part of a chain that failed, so a failed chain is
+        neither retried nor replayed command by command. Every command but
+        the last one is expected to answer OK.
+
+        :param at_cmds: The AT commands, each of them starting with AT.
+        :param at_rsp: The expected AT response of the last command.
+        :param cmd_type: The type of queue AT command of the last command.
+
+        :returns: The response of the last command that was run.
+        """
+        if self._at_chaining is None:
+            await self._probe_at_chaining()
+
+        if self._at_chaining:
+            return await self._run(b'AT' + b';'.join(c[2:] for c in at_cmds),
+                at_rsp, cmd_type=cmd_type, max_attempts=1)
+
+        for at_cmd in at_cmds[:-1]:
+            rsp = await self._run(at_cmd)
+            if rsp.result != _walter.ModemState.OK:
+                return rsp
+
+        return await self._run(at_cmds[-1], at_rsp, cmd_type=cmd_type)
+
     def begin(self, main_function=None):
         self._uart = UART(2, baudrate=WALTER_MODEM_BAUD, bits=8, parity=None, stop=1, \
                 flow=UART.RTS|UART.CTS, tx=WALTER_MODEM_PIN_TX, \
@@ -987,6 +1485,14 @@ class Modem:
         self._command_queue = Queue()
         self._parser_data = _walter.ModemATParserData()
 
+        # with the fast_io fork of uasyncio, give the UART reader priority
+        # over the other tasks by enabling the I/O queue, the stock uasyncio
+        # does not know the ioq_len argument
+        try:
+            uasyncio.get_event_loop(ioq_len=WALTER_MODEM_IOQ_LEN)
+        except TypeError:
+            pass
+
         uasyncio.run(self.reset())
         uasyncio.run(self.config_cme_error_reports(_walter.ModemCMEErrorReportsType.NUMERIC))
         uasyncio.run(self.config_cereg_reports(_walter.ModemCEREGReportsType.ENABLED))
@@ -1009,42 +1515,25 @@ class Modem:
         reset_pin.on()
 
         # also reset internal "modem mirror" state
-        self.__init__()
+        self._mirror_state_reset()
 
-        return await self._run_cmd('', b'+SYSSTART', None,
-                                   None, None,
-                                   _walter.ModemCmdType.WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run('', b'+SYSSTART',
+            cmd_type=_walter.ModemCmdType.WAIT)
 
     async def check_comm(self):
-        return await self._run_cmd('AT', b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b'AT')
 
     async def config_cme_error_reports(self, reports_type = _walter.ModemCMEErrorReportsType.NUMERIC):
-        return await self._run_cmd('AT+CMEE=%d' % reports_type, b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run('AT+CMEE=%d' % reports_type)
 
     async def config_cereg_reports(self, reports_type = _walter.ModemCEREGReportsType.ENABLED):
-        return await self._run_cmd('AT+CEREG=%d' % reports_type, b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run('AT+CEREG=%d' % reports_type)
 
     async def get_rssi(self):
-        return await self._run_cmd('AT+CSQ', b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b'AT+CSQ')
 
     async def get_signal_quality(self):
-        return await self._run_cmd('AT+CESQ', b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b'AT+CESQ')
 
     def get_network_reg_state(self):
         rsp = _walter.ModemRsp()
@@ -1056,50 +1545,38 @@ class Modem:
         return rsp
 
     async def get_op_state(self):
-        return await self._run_cmd('AT+CFUN?', b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b'AT+CFUN?')
         
     async def set_op_state(self, op_state):
-        return await self._run_cmd('AT+CFUN={}'.format(op_state), b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        if self._op_state_known and self._op_state == op_state:
+            # the modem is in this state already, skip the radio toggle
+            return static_rsp(_walter.ModemState.OK)
+
+        rsp = await self._run(b'AT+CFUN=%d' % op_state)
+        if rsp.result == _walter.ModemState.OK:
+            self._op_state = op_state
+            self._op_state_known = True
+
+        return rsp
         
     async def get_rat(self):
-        return await self._run_cmd('AT+SQNMODEACTIVE?', b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b'AT+SQNMODEACTIVE?')
 
     async def set_rat(self, rat):
-        return await self._run_cmd('AT+SQNMODEACTIVE=%d' % (rat + 1), b'OK', None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run('AT+SQNMODEACTIVE=%d' % (rat + 1))
 
     async def get_radio_bands(self):
-        return await self._run_cmd("AT+SQNBANDSEL?", b"OK", None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b"AT+SQNBANDSEL?")
 
     async def get_sim_state(self):
-        return await self._run_cmd("AT+CPIN?", b"OK", None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b"AT+CPIN?")
 
     async def unlock_sim(self, pin = None):
         self._simPIN = pin;
         if self._simPIN == None:
             return await self.get_sim_state()
         
-        return await self._run_cmd("AT+CPIN=%s" % pin, b"OK", None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run("AT+CPIN=%s" % pin)
 
     async def set_network_selection_mode(self,
         mode = _walter.ModemNetworkSelMode.AUTOMATIC,
@@ -1107,18 +1584,16 @@ class Modem:
         
         self._network_sel_mode = mode
         self._operator.format = format
-        self._operator.name = operator_name
+        if operator_name != self._operator.name:
+            self._operator.name = operator_name
+            self._operator_name_quoted = modem_string(operator_name)
 
         if mode == _walter.ModemNetworkSelMode.AUTOMATIC:
-            return await self._run_cmd("AT+COPS=%d" % mode, b"OK", None,
-                                       None, None,
-                                       _walter.ModemCmdType.TX_WAIT,
-                                       WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            return await self._run("AT+COPS=%d" % mode)
         else:
-            return await self._run_cmd("AT+COPS={},{},{}".format(
+            return await self._run("AT+COPS={},{},{}".format(
                 self._network_sel_mode,self._operator.format,
-                modem_string(self._operator.name)), b"OK", None, None, None,
-                _walter.ModemCmdType.TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+                self._operator_name_quoted))
 
     async def create_PDP_context(self, apn = None,
         auth_proto = _walter.ModemPDPAuthProtocol.NONE, auth_user = None,
@@ -1133,17 +1608,11 @@ class Modem:
         use_NAS_ipv4_MTU_discovery = False,
         use_local_addr_ind = False, use_NAS_on_IPMTU_discovery = False):
         
-        _ctx = None
-        for idx, ctx in enumerate(self._pdp_ctx_set):
-            if ctx.state == _walter.ModemPDPContextState.FREE:
-                ctx.state = _walter.ModemPDPContextState.RESERVED
-                _ctx = ctx
-                break
-
-        if _ctx == None:
+        if not self._pdp_free:
             return static_rsp(_walter.ModemState.NO_FREE_PDP_CONTEXT)
-        
-        self._pdp_ctx = _ctx
+
+        _ctx = self._pdp_ctx_set[self._pdp_free.popleft()]
+        _ctx.state = _walter.ModemPDPContextState.RESERVED
         
         _ctx.type = auth_type
         _ctx.apn = apn
@@ -1153,119 +1622,166 @@ class Modem:
         _ctx.ipv4_alloc_method = ipv4_alloc_method
         _ctx.request_type = request_type
         _ctx.pcscf_method = pcscf_method
-        _ctx.for_IMCN = for_IMCN
-        _ctx.use_NSLPI = use_NSLPI
-        _ctx.use_secure_PCO  = use_secure_PCO
-        _ctx.use_NAS_ipv4_MTU_discovery = use_NAS_ipv4_MTU_discovery
-        _ctx.use_local_addr_ind = use_local_addr_ind
-        _ctx.use_NAS_non_IPMTU_discovery = use_NAS_on_IPMTU_discovery
+        flag = _walter.ModemPDPContextFlag
+        _ctx.flags = ((flag.FOR_IMCN if for_IMCN else 0)
+            | (flag.USE_NSLPI if use_NSLPI else 0)
+            | (flag.USE_SECURE_PCO if use_secure_PCO else 0)
+            | (flag.USE_NAS_IPV4_MTU_DISCOVERY if use_NAS_ipv4_MTU_discovery else 0)
+            | (flag.USE_LOCAL_ADDR_IND if use_local_addr_ind else 0)
+            | (flag.USE_NAS_NON_IPMTU_DISCOVERY if use_NAS_on_IPMTU_discovery else 0))
         _ctx.auth_proto = auth_proto
         _ctx.auth_user = auth_user
         _ctx.auth_pass = auth_pass
+        if auth_proto == _walter.ModemPDPAuthProtocol.NONE:
+            _ctx.cgauth = None
+        else:
+            # the credentials are quoted once, they only change when the
+            # context is created again
+            _ctx.cgauth = _AT_CGAUTH % (_ctx.id, auth_proto,
+                modem_string(auth_user), modem_string(auth_pass))
+        _ctx.auth_applied = False
         
-        async def complete_handler(result, rsp, complete_handler_arg):
-            ctx = complete_handler_arg
-            rsp.type = _walter.ModemRspType.PDP_CTX_ID
-            rsp.pdp_ctx_id = _ctx.id
-
-            if result == _walter.ModemState.OK:
-                ctx.state = _walter.ModemPDPContextState.INACTIVE
-
-        return await self._run_cmd("AT+CGDCONT={},{},{},{},{},{},{},{},{},{},{},{},{},{},{}".format(
+        at_cmd = _AT_CGDCONT % (
             _ctx.id, pdp_type_as_string(_ctx.type), modem_string(_ctx.apn),
             modem_string(_ctx.pdp_address), _ctx.data_comp,
             _ctx.header_comp, _ctx.ipv4_alloc_method, _ctx.request_type,
-            _ctx.pcscf_method, modem_bool(_ctx.for_IMCN),
-            modem_bool(_ctx.use_NSLPI), modem_bool(_ctx.use_secure_PCO),
-            modem_bool(_ctx.use_NAS_ipv4_MTU_discovery),
-            modem_bool(_ctx.use_local_addr_ind),
-            modem_bool(_ctx.use_NAS_non_IPMTU_discovery)),
-            b"OK", None,
-            complete_handler, _ctx,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            _ctx.pcscf_method,
+            1 if for_IMCN else 0,
+            1 if use_NSLPI else 0,
+            1 if use_secure_PCO else 0,
+            1 if use_NAS_ipv4_MTU_discovery else 0,
+            1 if use_local_addr_ind else 0,
+            1 if use_NAS_on_IPMTU_discovery else 0)
+        rsp = await self._run(at_cmd, complete_handler=_pdp_create_complete,
+            complete_handler_arg=_ctx)
+
+        if _ctx.state == _walter.ModemPDPContextState.FREE:
+            # the modem did not define the context, hand it back
+            _ctx.cgdcont = None
+            self._pdp_free.append(_ctx.id - 1)
+        else:
+            _ctx.cgdcont = at_cmd
+            # only a context the modem defined becomes the one in use
+            self._pdp_ctx = _ctx
+
+        return rsp
+
+    async def redefine_PDP_context(self, context_id = -1):
+        """Define a PDP context on the modem again with the configuration it
+        was created with, e.g. after the modem lost its configuration. The
+        AT+CGDCONT command is reused as it was built by create_PDP_context.
+
+        :param context_id: The id of the PDP context, -1 for the context that
+        was last used.
+        """
+        _ctx = self._pdp_ctx_get(context_id)
+        if not _ctx or _ctx.cgdcont is None:
+            return static_rsp(_walter.ModemState.NO_SUCH_PDP_CONTEXT)
+
+        self._pdp_ctx = _ctx
+        # a modem that lost the context also lost its credentials
+        _ctx.auth_applied = False
+
+        return await self._run(_ctx.cgdcont)
 
     async def authenticate_PDP_context(self, context_id = None):
-        try:
-            _ctx = self._pdp_ctx_set[context_id - 1]
-        except:
+        _ctx = self._pdp_ctx_get(context_id)
+        if not _ctx:
             return static_rsp(_walter.ModemState.NO_SUCH_PDP_CONTEXT)
         
         self._pdp_ctx = _ctx
 
-        if _ctx.auth_proto == _walter.ModemPDPAuthProtocol.NONE:
+        if _ctx.cgauth is None or _ctx.auth_applied:
+            # nothing to send, the modem already has these credentials
             return static_rsp(_walter.ModemState.OK)
 
-        return await self._run_cmd("AT+CGAUTH={},{},{},{}".format(
-            _ctx.id, _ctx.auth_proto, modem_string(_ctx.auth_user),
-            modem_string(_ctx.auth_pass)),
-            b"OK", None,
-            None, None,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        rsp = await self._run(_ctx.cgauth)
+        if rsp.result == _walter.ModemState.OK:
+            _ctx.auth_applied = True
+
+        return rsp
 
     async def set_PDP_context_active(self, active = True, context_id = -1):
-        try:
-            if context_id == -1:
-                _ctx = self._pdp_ctx
-            else:
-                _ctx = self._pdp_ctx_set[context_id - 1]
-        except:
+        _ctx = self._pdp_ctx_get(context_id)
+        if not _ctx:
             return static_rsp(_walter.ModemState.NO_SUCH_PDP_CONTEXT)
         
         self._pdp_ctx = _ctx
 
-        async def complete_handler(result, rsp, complete_handler_arg):
-            ctx = complete_handler_arg
-            if result == _walter.ModemState.OK:
-                # TODO (cf arduino): set all other PDP contexts inactive
-                ctx.state = _walter.ModemPDPContextState.ACTIVE
+        rsp = await self._run(_AT_CGACT % (
+            1 if active else 0, _ctx.id))
+
+        if rsp.result == _walter.ModemState.OK:
+            # only one context is active at a time, so only the one that
+            # was active before has to be set inactive
+            prev = self._pdp_active_ctx
+            if active:
+                if prev and prev is not _ctx:
+                    prev.state = _walter.ModemPDPContextState.INACTIVE
+                _ctx.state = _walter.ModemPDPContextState.ACTIVE
+                self._pdp_active_ctx = _ctx
+            else:
+                _ctx.state = _walter.ModemPDPContextState.INACTIVE
+                if prev is _ctx:
+                    self._pdp_active_ctx = None
 
-        return await self._run_cmd("AT+CGACT={},{}".format(
-            _ctx.id, modem_bool(active)),
-            b"OK", None,
-            complete_handler, _ctx,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return rsp
 
     async def attach_PDP_context(self, attached = True):
-        async def complete_handler(result, rsp, complete_handler_arg):
-            if result == _walter.ModemState.OK:
-                if self._pdp_ctx:
-                    self._pdp_ctx.state = _walter.ModemPDPContextState.ATTACHED
+        return await self._run(_AT_CGATT[1 if attached else 0],
+            complete_handler=_pdp_attach_complete,
+            complete_handler_arg=self._pdp_ctx)
+
+    async def pdp_bring_up(self, context_id = -1):
+        """Authenticate, activate and attach a created PDP context.
 
-        return await self._run_cmd("AT+CGATT={}".format(
-            modem_bool(attached)),
-            b"OK", None,
-            complete_handler, None,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        The AT+CGAUTH (only when the context uses authentication), AT+CGACT
+        and AT+CGATT commands are chained into a single round trip when the
+        modem supports it, see _run_cmd_chain.
+
+        :param context_id: The id of the PDP context, -1 for the context
+        that was last used.
+
+        :returns: The response of the last command that was run.
+        """
+        _ctx = self._pdp_ctx_get(context_id)
+        if not _ctx:
+            return static_rsp(_walter.ModemState.NO_SUCH_PDP_CONTEXT)
+
+        self._pdp_ctx = _ctx
+
+        at_cmds = []
+        if _ctx.cgauth is not None and not _ctx.auth_applied:
+            at_cmds.append(_ctx.cgauth)
+        at_cmds.append(_AT_CGACT % (1, _ctx.id))
+        at_cmds.append(_AT_CGATT[1])
+
+        rsp = await self._run_cmd_chain(at_cmds, b"OK",
+            _walter.ModemCmdType.TX_WAIT)
+        if rsp.result == _walter.ModemState.OK:
+            prev = self._pdp_active_ctx
+            if prev and prev is not _ctx:
+                prev.state = _walter.ModemPDPContextState.INACTIVE
+            _ctx.state = _walter.ModemPDPContextState.ATTACHED
+            self._pdp_active_ctx = _ctx
+            if _ctx.cgauth is not None:
+                _ctx.auth_applied = True
+
+        return rsp
 
     async def get_PDP_address(self, context_id = -1):
-        try:
-            if context_id == -1:
-                _ctx = self._pdp_ctx
-            else:
-                _ctx = self._pdp_ctx_set[context_id - 1]
-        except:
+        _ctx = self._pdp_ctx_get(context_id)
+        if not _ctx:
             return static_rsp(_walter.ModemState.NO_SUCH_PDP_CONTEXT)
         
         self._pdp_ctx = _ctx
 
-        return await self._run_cmd("AT+CGPADDR={}".format(_ctx.id),
-            b"OK", None,
-            None, None,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_CGPADDR % _ctx.id)
 
     async def create_socket(self, pdp_context_id = -1, mtu = 300, exchange_timeout = 90,
             conn_timeout = 60, send_delay_ms = 5000):
-        try:
-            if pdp_context_id == -1:
-                _ctx = self._pdp_ctx
-            else:
-                _ctx = self._pdp_ctx_set[pdp_context_id - 1]
-        except:
+        _ctx = self._pdp_ctx_get(pdp_context_id)
+        if not _ctx:
             return static_rsp(_walter.ModemState.NO_SUCH_PDP_CONTEXT)
         
         self._pdp_ctx = _ctx
@@ -1296,21 +1812,14 @@ class Modem:
             if result == _walter.ModemState.OK:
                 sock.state = _walter.ModemSocketState.CREATED
 
-        return await self._run_cmd("AT+SQNSCFG={},{},{},{},{},{}".format(
+        return await self._run(_AT_SQNSCFG % (
             _socket.id, _ctx.id, _socket.mtu, _socket.exchange_timeout,
             _socket.conn_timeout * 10, _socket.send_delay_ms // 100),
-            b"OK", None,
-            complete_handler, _socket,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            complete_handler=complete_handler, complete_handler_arg=_socket)
 
     async def config_socket(self, socket_id = -1):
-        try:
-            if socket_id == -1:
-                _socket = self._socket
-            else:
-                _socket = self._socket_set[socket_id - 1]
-        except:
+        _socket = self._socket_get(socket_id)
+        if not _socket:
             return static_rsp(_walter.ModemState.NO_SUCH_SOCKET)
         
         self._socket = _socket
@@ -1321,29 +1830,23 @@ class Modem:
             if result == _walter.ModemState.OK:
                 sock.state = _walter.ModemSocketState.CONFIGURED
 
-        return await self._run_cmd("AT+SQNSCFGEXT={},2,0,0,0,0,0".format(
-            _socket.id),
-            b"OK", None,
-            complete_handler, _socket,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_SQNSCFGEXT[_socket.id - 1],
+            complete_handler=complete_handler, complete_handler_arg=_socket)
 
     async def connect_socket(self, remote_host, remote_port,
             local_port = 0, protocol = _walter.ModemSocketProto.UDP,
             accept_any_remote = _walter.ModemSocketAcceptAnyRemote.DISABLED , socket_id = -1):
-        try:
-            if socket_id == -1:
-                _socket = self._socket
-            else:
-                _socket = self._socket_set[socket_id - 1]
-        except:
+        _socket = self._socket_get(socket_id)
+        if not _socket:
             return static_rsp(_walter.ModemState.NO_SUCH_SOCKET)
         
         self._socket = _socket
 
         _socket.protocol = protocol
         _socket.accept_any_remote = accept_any_remote
-        _socket.remote_host = remote_host
+        if remote_host != _socket.remote_host:
+            _socket.remote_host = remote_host
+            _socket.remote_host_quoted = modem_string(remote_host)
         _socket.remote_port = remote_port
         _socket.local_port = local_port
 
@@ -1353,22 +1856,50 @@ class Modem:
             if result == _walter.ModemState.OK:
                 sock.state = _walter.ModemSocketState.OPENED
 
-        return await self._run_cmd("AT+SQNSD={},{},{},{},0,{},1,{},0".format(
+        return await self._run(_AT_SQNSD % (
             _socket.id, _socket.protocol, _socket.remote_port,
-            modem_string(_socket.remote_host), _socket.local_port,
+            _socket.remote_host_quoted, _socket.local_port,
             _socket.accept_any_remote),
-            b"OK", None,
-            complete_handler, _socket,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            complete_handler=complete_handler, complete_handler_arg=_socket)
+
+    async def socket_configure_and_connect(self, remote_host, remote_port,
+            local_port = 0, protocol = _walter.ModemSocketProto.UDP,
+            accept_any_remote = _walter.ModemSocketAcceptAnyRemote.DISABLED, socket_id = -1):
+        """Configure and connect a created socket.
+
+        Does the work of config_socket and connect_socket, the AT+SQNSCFGEXT
+        and AT+SQNSD commands are chained into a single round trip when the
+        modem supports it, see _run_cmd_chain.
+
+        :returns: The response of the last command that was run.
+        """
+        _socket = self._socket_get(socket_id)
+        if not _socket:
+            return static_rsp(_walter.ModemState.NO_SUCH_SOCKET)
+
+        self._socket = _socket
+
+        _socket.protocol = protocol
+        _socket.accept_any_remote = accept_any_remote
+        if remote_host != _socket.remote_host:
+            _socket.remote_host = remote_host
+            _socket.remote_host_quoted = modem_string(remote_host)
+        _socket.remote_port = remote_port
+        _socket.local_port = local_port
+
+        rsp = await self._run_cmd_chain((
+            _AT_SQNSCFGEXT[_socket.id - 1],
+            _AT_SQNSD % (_socket.id, protocol, remote_port,
+                _socket.remote_host_quoted, local_port, accept_any_remote)),
+            b"OK", _walter.ModemCmdType.TX_WAIT)
+        if rsp.result == _walter.ModemState.OK:
+            _socket.state = _walter.ModemSocketState.OPENED
+
+        return rsp
 
     async def close_socket(self, socket_id = -1):
-        try:
-            if socket_id == -1:
-                _socket = self._socket
-            else:
-                _socket = self._socket_set[socket_id - 1]
-        except:
+        _socket = self._socket_get(socket_id)
+        if not _socket:
             return static_rsp(_walter.ModemState.NO_SUCH_SOCKET)
         
         self._socket = _socket
@@ -1379,57 +1910,94 @@ class Modem:
             if result == _walter.ModemState.OK:
                 sock.state = _walter.ModemSocketState.FREE
 
-        return await self._run_cmd("AT+SQNSH={}".format(_socket.id),
-            b"OK", None,
-            complete_handler, _socket,
-            _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_SQNSH[_socket.id - 1],
+            complete_handler=complete_handler, complete_handler_arg=_socket)
 
     async def socket_send(self, data, rai = _walter.ModemRai.NO_INFO, socket_id = -1):
-        try:
-            if socket_id == -1:
-                _socket = self._socket
-            else:
-                _socket = self._socket_set[socket_id - 1]
-        except:
+        _socket = self._socket_get(socket_id)
+        if not _socket:
             return static_rsp(_walter.ModemState.NO_SUCH_SOCKET)
         
         self._socket = _socket
 
-        return await self._run_cmd("AT+SQNSSENDEXT={},{},{}".format(
+        return await self._run(_AT_SQNSSENDEXT % (
             _socket.id, len(data), rai),
-            b"OK", data,
-            None, None,
-            _walter.ModemCmdType.DATA_TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            data=data, cmd_type=_walter.ModemCmdType.DATA_TX_WAIT)
+
+    async def socket_send_batch(self, payloads, rai = _walter.ModemRai.NO_INFO,
+            socket_id = -1, max_coalesce = None, keep_boundaries = False):
+        """Send a number of payloads with as few AT+SQNSSENDEXT commands as
+        possible.
+
+        Adjacent payloads are joined into one send of at most max_coalesce
+        bytes, a payload is never split over two sends. A single payload
+        larger than max_coalesce is sent on its own as is, just like
+        socket_send would. The boundaries between joined payloads are not
+        kept, on a UDP socket they arrive as a single datagram. Pass
+        keep_boundaries to send every payload on its own with socket_send.
+
+        :param payloads: An iterable of bytes-like payloads.
+        :param rai: The release assistance information of the last send.
+        :param socket_id: The id of the socket, -1 for the socket that was
+        last used.
+        :param max_coalesce: The maximum size of a send, the MTU of the
+        socket when None.
+        :param keep_boundaries: Send every payload in its own send.
+
+        :returns: The response of the last send that was run.
+        """
+        _socket = self._socket_get(socket_id)
+        if not _socket:
+            return static_rsp(_walter.ModemState.NO_SUCH_SOCKET)
+
+        self._socket = _socket
+
+        if max_coalesce is None:
+            max_coalesce = _socket.mtu
+
+        rsp = static_rsp(_walter.ModemState.OK)
+        pending = None
+        buf = bytearray()
+        for payload in payloads:
+            if keep_boundaries:
+                # one payload behind, so only the last send carries rai
+                if pending is not None:
+                    rsp = await self.socket_send(pending,
+                        _walter.ModemRai.NO_INFO, _socket.id)
+                    if rsp.result != _walter.ModemState.OK:
+                        return rsp
+                pending = payload
+                continue
+
+            if buf and len(buf) + len(payload) > max_coalesce:
+                rsp = await self.socket_send(buf, _walter.ModemRai.NO_INFO,
+                    _socket.id)
+                if rsp.result != _walter.ModemState.OK:
+                    return rsp
+                buf = bytearray()
+
+            buf.extend(payload)
+
+        if pending is not None:
+            rsp = await self.socket_send(pending, rai, _socket.id)
+        elif buf:
+            rsp = await self.socket_send(buf, rai, _socket.id)
+
+        return rsp
 
     async def get_clock(self):
-        return await self._run_cmd('AT+CCLK?', b'OK', None,
-                None, None,
-                _walter.ModemCmdType.TX_WAIT,
-                WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b'AT+CCLK?')
 
     async def config_gnss(self, sens_mode = _walter.ModemGNSSSensMode.HIGH, acq_mode = _walter.ModemGNSSAcqMode.COLD_WARM_START, loc_mode = _walter.ModemGNSSLocMode.ON_DEVICE_LOCATION):
-        return await self._run_cmd("AT+LPGNSSCFG=%d,%d,2,,1,%d" %
-                                   (loc_mode, sens_mode, acq_mode),
-                                   b"OK", None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run("AT+LPGNSSCFG=%d,%d,2,,1,%d" %
+                                   (loc_mode, sens_mode, acq_mode))
 
     async def get_gnss_assistance_status(self):
-        return await self._run_cmd("AT+LPGNSSASSISTANCE?",
-                                   b"OK", None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(b"AT+LPGNSSASSISTANCE?")
 
     async def update_gnss_assistance(self, ass_type = _walter.ModemGNSSAssistanceType.REALTIME_EPHEMERIS ):
-        return await self._run_cmd("AT+LPGNSSASSISTANCE=%d" % ass_type,
-                                   b"+LPGNSSASSISTANCE:", None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run("AT+LPGNSSASSISTANCE=%d" % ass_type,
+            b"+LPGNSSASSISTANCE:")
 
     async def perform_gnss_action(self, action = _walter.ModemGNSSAction.GET_SINGLE_FIX):
         if action == _walter.ModemGNSSAction.GET_SINGLE_FIX:
@@ -1439,11 +2007,7 @@ class Modem:
         else:
             action_str = ""
 
-        return await self._run_cmd("AT+LPGNSSFIXPROG=\"%s\"" % action_str,
-                                   b"OK", None,
-                                   None, None,
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run("AT+LPGNSSFIXPROG=\"%s\"" % action_str)
 
     async def wait_for_gnss_fix(self):
         gnss_fix_waiter = _walter.ModemGnssFixWaiter()
@@ -1459,61 +2023,79 @@ class Modem:
         if self._http_current_profile != 0xff:
             return static_rsp(_walter.ModemState.ERROR)
 
-        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+        if not _valid_http_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
 
-        if self._http_context_set[profile_id].state == _walter.ModemHttpContextState.IDLE:
+        ctx = self._http_ctx(profile_id)
+        state = ctx.state
+        ctx_state = _walter.ModemHttpContextState
+
+        if state == ctx_state.IDLE:
             return static_rsp(_walter.ModemState.NOT_EXPECTING_RING)
 
-        if self._http_context_set[profile_id].state == _walter.ModemHttpContextState.EXPECT_RING:
+        if state == ctx_state.EXPECT_RING:
             return static_rsp(_walter.ModemState.AWAITING_RING)
 
-        if self._http_context_set[profile_id].state != _walter.ModemHttpContextState.GOT_RING:
+        if state != ctx_state.GOT_RING:
             return static_rsp(_walter.ModemState.ERROR)
 
         # ok, got ring. http context fields have been filled.
         # http status 0 means: timeout (or also disconnected apparently)
-        if self._http_context_set[profile_id].http_status == 0:
-            self._http_context_set[profile_id].state = _walter.ModemHttpContextState.IDLE
+        if ctx.http_status == 0:
+            ctx.state = ctx_state.IDLE
             return static_rsp(_walter.ModemState.ERROR)
 
         self._http_current_profile = profile_id;
 
-        async def complete_handler(result, rsp, complete_handler_arg):
-            modem = complete_handler_arg
-            modem._http_context_set[modem._http_current_profile].state = _walter.ModemHttpContextState.IDLE
-            modem._http_current_profile = 0xff
-
-        return await self._run_cmd("AT+SQNHTTPRCV={}".format(profile_id),
-            b"<<<", None, complete_handler, self, _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_HTTP_RCV % profile_id, b"<<<",
+            complete_handler=_http_did_ring_complete,
+            complete_handler_arg=self)
 
-    async def http_config_profile(self, profile_id, server_name, port = 80, use_basic_auth = False, auth_user = '', auth_pass = ''):
-        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+    async def http_config_profile(self, profile_id, server_name, port = 80, use_basic_auth = False, auth_user = '', auth_pass = '', force = False):
+        if not _valid_http_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
 
-        return await self._run_cmd("AT+SQNHTTPCFG={},{},{},{},\"{}\",\"{}\"".format(profile_id, modem_string(server_name), port, modem_bool(use_basic_auth), auth_user, auth_pass),
-            b"OK", None, None, None, _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        # the profile is stored persistently in the modem, skip the command
+        # when it is re-asserted with the configuration that was last applied
+        config = (server_name, port, use_basic_auth, auth_user, auth_pass)
+        if not force and self._http_ctx(profile_id).config == config:
+            return static_rsp(_walter.ModemState.OK)
+
+        return await self._run(_AT_HTTP_CFG % (profile_id, modem_string(server_name), port, modem_bool(use_basic_auth), auth_user, auth_pass),
+            complete_handler=_http_config_complete,
+            complete_handler_arg=(self._http_ctx(profile_id), config))
 
     async def http_connect(self, profile_id):
-        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+        if not _valid_http_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
 
-        return await self._run_cmd("AT+SQNHTTPCONNECT={}".format(profile_id),
-            b"OK", None, None, None, _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_HTTP_CONNECT % profile_id)
+
+    async def http_configure_and_connect(self, profile_id, server_name, port = 80, use_basic_auth = False, auth_user = '', auth_pass = '', force = False):
+        if not _valid_http_profile(profile_id):
+            return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
+
+        ctx = self._http_ctx(profile_id)
+        config = (server_name, port, use_basic_auth, auth_user, auth_pass)
+        if not force and ctx.config == config:
+            return await self.http_connect(profile_id)
+
+        rsp = await self._run_cmd_chain((
+            _AT_HTTP_CFG % (profile_id, modem_string(server_name), port, modem_bool(use_basic_auth), auth_user, auth_pass),
+            _AT_HTTP_CONNECT % profile_id),
+            b"OK", _walter.ModemCmdType.TX_WAIT)
+        if rsp.result == _walter.ModemState.OK:
+            ctx.config = config
+        return rsp
 
     async def http_close(self, profile_id):
-        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+        if not _valid_http_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
 
-        return await self._run_cmd("AT+SQNHTTPDISCONNECT={}".format(profile_id),
-            b"OK", None, None, None, _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_HTTP_DISCONNECT % profile_id)
 
     def http_get_context_status(self, profile_id):
-        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+        if not _valid_http_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
 
         # note: in my observation the SQNHTTPCONNECT command is to be avoided.
@@ -1526,99 +2108,105 @@ class Modem:
         # (too bad: according to the docs SQNHTTPCONNECT is mandatory for
         # TLS connections)
 
-        return self._http_context_set[profile_id].connected;
+        return self._http_ctx(profile_id).connected;
 
     async def http_query(self, profile_id, uri, query_cmd = _walter.ModemHttpQueryCmd.GET):
-        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+        if not _valid_http_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
 
-        if self._http_context_set[profile_id].state != _walter.ModemHttpContextState.IDLE:
+        ctx = self._http_ctx(profile_id)
+        if ctx.state != _walter.ModemHttpContextState.IDLE:
             return static_rsp(_walter.ModemState.BUSY)
 
-        async def complete_handler(result, rsp, complete_handler_arg):
-            ctx = complete_handler_arg
-
-            if result == _walter.ModemState.OK:
-                ctx.state = _walter.ModemHttpContextState.EXPECT_RING
-
-        return await self._run_cmd("AT+SQNHTTPQRY={},{},{}".format(profile_id, query_cmd, modem_string(uri)),
-            b"OK", None, complete_handler, self._http_context_set[profile_id],
-            _walter.ModemCmdType.TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_HTTP_QRY % (profile_id, query_cmd, modem_string(uri)),
+            complete_handler=_http_expect_ring_complete,
+            complete_handler_arg=ctx)
 
     async def http_send(self, profile_id, uri, data, send_cmd = _walter.ModemHttpSendCmd.POST, post_param = _walter.ModemHttpPostParam.UNSPECIFIED):
-        if profile_id >= WALTER_MODEM_MAX_HTTP_PROFILES:
+        if not _valid_http_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
 
-        if self._http_context_set[profile_id].state != _walter.ModemHttpContextState.IDLE:
+        ctx = self._http_ctx(profile_id)
+        if ctx.state != _walter.ModemHttpContextState.IDLE:
             return static_rsp(_walter.ModemState.BUSY)
 
-        async def complete_handler(result, rsp, complete_handler_arg):
-            ctx = complete_handler_arg
-
-            if result == _walter.ModemState.OK:
-                ctx.state = _walter.ModemHttpContextState.EXPECT_RING
+        # the modem expects the body length in bytes, not in characters
+        if isinstance(data, str):
+            data = data.encode()
+        data_len = len(data)
 
         if post_param == _walter.ModemHttpPostParam.UNSPECIFIED:
-            return await self._run_cmd("AT+SQNHTTPSND={},{},{},{}".format(
-                profile_id, send_cmd, modem_string(uri), len(data)),
-                b"OK", data, complete_handler, self._http_context_set[profile_id],
-                _walter.ModemCmdType.DATA_TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            at_cmd = _AT_HTTP_SND % (
+                profile_id, send_cmd, modem_string(uri), data_len)
         else:
-            return await self._run_cmd("AT+SQNHTTPSND={},{},{},{},\"{}\"".format(
-                profile_id, send_cmd, modem_string(uri), len(data), post_param),
-                b"OK", data, complete_handler, self._http_context_set[profile_id],
-                _walter.ModemCmdType.DATA_TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            at_cmd = _AT_HTTP_SND_PARAM % (
+                profile_id, send_cmd, modem_string(uri), data_len, post_param)
 
-    """
-    Coroutine to configure a connection to an MQTT broker,
-    called internally just before establishing the connection.
-    """
-    async def _mqtt_config(self, client_id, user_name, password, tls_profile_id):
-        return await self._run_cmd("AT+SQNSMQTTCFG=0,{},{},{},{}".format(
-            modem_string(client_id), modem_string(user_name), modem_string(password), tls_profile_id),
-            b"OK", None, None, None, _walter.ModemCmdType.TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(at_cmd, data=data,
+            complete_handler=_http_expect_ring_complete,
+            complete_handler_arg=ctx,
+            cmd_type=_walter.ModemCmdType.DATA_TX_WAIT)
 
     """
     Disconnect from an MQTT broker
     """
     async def mqtt_disconnect(self):
-        return await self._run_cmd("AT+SQNSMQTTDISCONNECT=0",
-            b"+SQNSMQTTONDISCONNECT:0,0", None, None, None,
-            _walter.ModemCmdType.TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        return await self._run(_AT_MQTT_DISCONNECT, _RSP_MQTT_DISCONNECT)
 
     """
     Coroutine to establish a connection to an MQTT broker,
     also wrapping the configuration of the connection.
-    This follows the logic of the Arduino example.
+    This follows the logic of the Arduino example, the configuration and
+    the connect command are chained into a single round trip when the modem
+    supports it.
     """
     async def mqtt_connect(self, server_name, port, client_id, user_name, password, tls_profile_id):
-        rsp = await self._mqtt_config(client_id, user_name, password, tls_profile_id)
-        if rsp.result != _walter.ModemState.OK:
-            print('Failed to configure mqtt client.')
-            return rsp
-        print('MQTT client configured.')
-        return await self._run_cmd("AT+SQNSMQTTCONNECT=0,{},{}".format(
-            modem_string(server_name), port),
-            b"+SQNSMQTTONCONNECT:0,0", None, None, None,
-            _walter.ModemCmdType.TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        self._mqtt_subscriptions.clear()
+
+        return await self._run_cmd_chain((
+            _AT_MQTT_CFG % (modem_string(client_id), modem_string(user_name),
+                modem_string(password), tls_profile_id),
+            _AT_MQTT_CONNECT % (modem_string(server_name), port)),
+            _RSP_MQTT_CONNECT, _walter.ModemCmdType.TX_WAIT)
 
     """
     Coroutine to publish a new MQTT message to a given topic
     """
     async def mqtt_publish(self, topic, payload, qos):
-        return await self._run_cmd("AT+SQNSMQTTPUBLISH=0,{},{},{}".format(
-            modem_string(topic), qos, len(payload)),
-            b"+SQNSMQTTONPUBLISH:0,", payload, None, None,
-            _walter.ModemCmdType.DATA_TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        if len(payload) > WALTER_MODEM_MQTT_MAX_MESSAGE_LEN:
+            return static_rsp(_walter.ModemState.ERROR)
+
+        cache = self._mqtt_pub_prefix_cache
+        key = (topic, qos)
+        prefix = cache.get(key)
+        if prefix is None:
+            if len(cache) >= _MQTT_PUB_PREFIX_CACHE_SIZE:
+                cache.clear()
+            prefix = cache[key] = _AT_MQTT_PUBLISH_PREFIX % (modem_topic_string(topic), qos)
+
+        return await self._run(prefix + b'%d' % len(payload),
+            b"+SQNSMQTTONPUBLISH:0,", data=payload,
+            cmd_type=_walter.ModemCmdType.DATA_TX_WAIT)
 
     """
     Coroutine to subscribe to an MQTT topic
     """
     async def mqtt_subscribe(self, topic, qos):
-        return await self._run_cmd("AT+SQNSMQTTSUBSCRIBE=0,{},{}".format(
-            modem_string(topic), qos),
-            b"+SQNSMQTTONSUBSCRIBE:0,{}".format(modem_string(topic)), None, None, None,
-            _walter.ModemCmdType.TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+        topic = self._mqtt_intern_topic(topic)
+        key = (topic, qos)
+
+        # resubscribing on the same connection is a no-op for the broker
+        if self._mqtt_status == _walter.ModemMqttState.CONNECTED \
+        and key in self._mqtt_subscriptions:
+            return static_rsp(_walter.ModemState.OK)
+
+        topic_str = modem_topic_string(topic)
+        rsp = await self._run(_AT_MQTT_SUBSCRIBE % (topic_str, qos),
+            _RSP_MQTT_SUBSCRIBE % topic_str)
+        if rsp.result == _walter.ModemState.OK:
+            self._mqtt_subscriptions.add(key)
+
+        return rsp
 
     """
     Coroutine to set up a tls profile. The parameters are the slots in the NVRAM
@@ -1628,23 +2216,20 @@ class Modem:
     async def tls_config_profile(self, profile_id, tls_valid, tls_version,
                                  ca_certificate_id, client_certificate_id,
                                  client_priv_key_id):
-        if profile_id >= WALTER_MODEM_MAX_TLS_PROFILES:
+        if not _valid_tls_profile(profile_id):
             return static_rsp(_walter.ModemState.NO_SUCH_PROFILE)
-        return await self._run_cmd("AT+SQNSPCFG={},{},\"\",{},{},{},{},\"\",\"\",0,0,0".format(
+        return await self._run("AT+SQNSPCFG={},{},\"\",{},{},{},{},\"\",\"\",0,0,0".format(
             profile_id, tls_version, tls_valid, modem_number(ca_certificate_id),
-            modem_number(client_certificate_id), modem_number(client_priv_key_id)),
-            b"OK", None, None, None,
-            _walter.ModemCmdType.TX_WAIT, WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            modem_number(client_certificate_id), modem_number(client_priv_key_id)))
 
     """
     Coroutine to store a certificate or a key in the NVRAM of the modem
     """
     async def _tls_upload_key(self, is_private_key, slot_idx, key):
         key_type = "privatekey" if is_private_key else "certificate"
-        return await self._run_cmd("AT+SQNSNVW={},{},{}".format(
+        return await self._run("AT+SQNSNVW={},{},{}".format(
             modem_string(key_type), slot_idx, len(key)),
-            b"OK", key, None, None, _walter.ModemCmdType.DATA_TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            data=key, cmd_type=_walter.ModemCmdType.DATA_TX_WAIT)
 
     """
     Coroutine to store certificates and/or keys in the NVRAM of the modem.
@@ -1680,39 +2265,58 @@ class Modem:
     Coroutine to initiate delivery of an MQTT message by the modem
     The payload of the MQTT message will be stored in the 'payload' property
     of the corresponding ModemMqttMessage instance within the
-    _mqtt_messages list
+    _mqtt_pending list
     """
-    async def _mqtt_receive_message(self, topic, message_id = None, max_length = None):
-        at_cmd = "AT+SQNSMQTTRCVMESSAGE=0,{}".format(modem_string(topic))
-        if message_id:
-            at_cmd += ",{}".format(message_id)
+    async def _mqtt_receive_message(self, topic, message_id = None, max_length = None, rsp = None):
+        topic = modem_topic_string(topic)
         if max_length:
-            at_cmd += ",{}".format(max_length)
-        return await self._run_cmd(at_cmd, b"OK", None, None, None, 
-                                   _walter.ModemCmdType.TX_WAIT,
-                                   WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
+            at_cmd = _AT_MQTT_RCV_ID_LEN % (topic, message_id or '', max_length)
+        elif message_id:
+            at_cmd = _AT_MQTT_RCV_ID % (topic, message_id)
+        else:
+            at_cmd = _AT_MQTT_RCV % topic
+        return await self._run(at_cmd, rsp=rsp,
+            collect_rsp_type=_walter.ModemRspType.MQTT)
 
     """
     Coroutine to 'download' the payloads of all MQTT messages that are stored
     in the buffer of the modem and have not yet been downloaded from the modem
     into the controller.
+    The receive commands of up to max_batch messages are queued at once, so
+    the modem gets the next command as soon as the previous one completed.
     The return value is the number of all downloaded messages.
     """
-    async def mqtt_receive(self):
-        n = 0 
-        for msg in self._mqtt_messages:
-            if not msg.received:
-                rsp = await self._mqtt_receive_message(msg.topic, msg.message_id)
+    async def mqtt_receive(self, max_batch = WALTER_MODEM_MQTT_RECEIVE_BATCH):
+        # visit every message pending at the start once, the ones that could
+        # not be downloaded are queued again at the back
+        pending = self._mqtt_pending
+        todo = len(pending)
+
+        # one response object per command of a batch, reused for every batch
+        rsp_pool = self._mqtt_rsp_pool
+        while len(rsp_pool) < min(todo, max_batch):
+            rsp_pool.append(_walter.ModemRsp())
+
+        while todo:
+            batch = [pending.popleft() for _ in range(min(todo, max_batch))]
+            todo -= len(batch)
+            rsps = await uasyncio.gather(*[
+                self._mqtt_receive_message(msg.topic, msg.message_id, None, rsp_pool[i])
+                for i, msg in enumerate(batch)])
+
+            for msg, rsp in zip(batch, rsps):
                 if rsp.result != _walter.ModemState.OK:
                     print('Failed to receive MQTT message.')
                 elif rsp.type == _walter.ModemRspType.MQTT:
                     msg.payload = rsp.mqtt_data
                     msg.received = True
-                    n += 1
-            else:
-                # include messages in the count that have already been downloaded previously
-                n += 1
-        return n
+                    self._mqtt_pending_ids.discard((msg.message_id, msg.topic))
+                    self._mqtt_received.append(msg)
+                    continue
+                pending.append(msg)
+
+        # include messages in the count that have already been downloaded previously
+        return len(self._mqtt_received)
     """
     Function to get the first of the 'received' messages in the list, 
     'received' meaning the payload has been downloaded from the buffer
@@ -1720,15 +2324,168 @@ class Modem:
     Return value is a ModemMqttMessage
     """
     def get_mqtt_message(self):
-        for msg in self._mqtt_messages:
-            if msg.received:
-                self._mqtt_messages.remove(msg)
-                return msg
+        if self._mqtt_received:
+            return self._mqtt_received.popleft()
     """
     Coroutine to turn off the modem
     """
     async def shutdown(self):
-        return await self._run_cmd("AT+SQNSSHDN",
-            b"+SHUTDOWN", None, None, None, _walter.ModemCmdType.TX_WAIT,
-            WALTER_MODEM_DEFAULT_CMD_ATTEMPTS)
-    
\ No newline at end of file
+        return await self._run(b"AT+SQNSSHDN", b"+SHUTDOWN")
+    
+
+class ModemHttpBatcher:
+    """Coalesce small HTTP bodies into a single http_send.
+
+    Bodies passed to send() are appended to a buffer which is posted in one
+    AT+SQNHTTPSND when the next body would not fit in max_bytes, when
+    max_delay_ms passed since the first buffered body or when flush() is
+    called. The bodies are concatenated as is, so the caller must use a
+    self-delimiting format such as newline separated JSON.
+
+    The batcher reads the answer to every post itself with http_did_ring,
+    the profile must not be used for other queries while it is in use.
+    The buffer never grows beyond max_bytes: bodies that failed to post are
+    kept for the next flush as long as they fit, otherwise they are dropped
+    with a warning. A body larger than max_bytes is posted on its own and
+    never buffered. Posts never overlap, flushes run one at a time.
+    """
+    def __init__(self, modem, profile_id, uri, max_bytes = 2048,
+            max_delay_ms = 100,
+            post_param = _walter.ModemHttpPostParam.OCTET_STREAM,
+            ring_timeout_ms = 30000):
+        self._modem = modem
+        self._profile_id = profile_id
+        self._uri = uri
+        self._max_bytes = max_bytes
+        self._max_delay_ms = max_delay_ms
+        self._post_param = post_param
+        self._ring_timeout_ms = ring_timeout_ms
+
+        """The bodies which are not posted yet."""
+        self._buf = bytearray()
+
+        """The task flushing the buffer after max_delay_ms."""
+        self._timer = None
+
+        """Serialises the flushes, the profile takes one post at a time."""
+        self._lock = uasyncio.Lock()
+
+    async def _flush_later(self):
+        await uasyncio.sleep_ms(self._max_delay_ms)
+        self._timer = None
+        rsp = await self.flush()
+        if rsp.result != _walter.ModemState.OK:
+            print('HTTP batch flush failed (%d), %d bytes kept.' % (
+                rsp.result, len(self._buf)))
+
+    async def _drain_ring(self):
+        """Read the answer to the previous post, the profile only accepts a
+        new post once the answer is read.
+
+        :returns: The response of http_did_ring or BUSY when no answer
+        arrived within ring_timeout_ms.
+        """
+        modem = self._modem
+        deadline = time.ticks_add(time.ticks_ms(), self._ring_timeout_ms)
+        while True:
+            rsp = await modem.http_did_ring(self._profile_id)
+            if rsp.result != _walter.ModemState.AWAITING_RING:
+                return rsp
+
+            if time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+                return static_rsp(_walter.ModemState.BUSY)
+
+            await uasyncio.sleep_ms(_HTTP_BATCH_RING_POLL_MS)
+
+    async def send(self, body):
+        """Buffer a body, posting the buffer first when the body does not fit.
+
+        :returns: The response of the flush or post this caused, if any.
+        When the result is not OK and the buffer still holds bodies that
+        failed to post, the body was not taken. A body larger than max_bytes
+        is not taken when its own post fails.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+
+        if len(body) > self._max_bytes:
+            # too large to buffer, post it on its own after the buffer
+            rsp = await self.flush()
+            if self._buf:
+                return rsp
+
+            async with self._lock:
+                posted, rsp = await self._post(body)
+            return rsp
+
+        rsp = None
+        if self._buf and len(self._buf) + len(body) > self._max_bytes:
+            rsp = await self.flush()
+            if self._buf and len(self._buf) + len(body) > self._max_bytes:
+                # the link is down and the buffer is full, refuse the body
+                return rsp
+
+        self._buf.extend(body)
+
+        if len(self._buf) >= self._max_bytes:
+            return await self.flush()
+
+        if not self._timer:
+            self._timer = uasyncio.create_task(self._flush_later())
+
+        return rsp if rsp else static_rsp(_walter.ModemState.OK)
+
+    async def _post(self, data):
+        """Post data once the previous answer is read and read its answer.
+
+        Must be called with the lock held.
+
+        :returns: A tuple of a flag telling if the data was posted and the
+        response, see flush.
+        """
+        ctx = self._modem._http_ctx(self._profile_id)
+        if ctx.state != _walter.ModemHttpContextState.IDLE:
+            await self._drain_ring()
+            if ctx.state != _walter.ModemHttpContextState.IDLE:
+                return False, static_rsp(_walter.ModemState.BUSY)
+
+        rsp = await self._modem.http_send(self._profile_id, self._uri, data,
+                _walter.ModemHttpSendCmd.POST, self._post_param)
+        if rsp.result != _walter.ModemState.OK:
+            return False, rsp
+
+        ring_rsp = await self._drain_ring()
+        if ring_rsp.result == _walter.ModemState.BUSY:
+            # posted, the next post reads the answer
+            return True, rsp
+
+        return True, ring_rsp
+
+    async def flush(self):
+        """Post the buffered bodies.
+
+        :returns: The response of http_did_ring for the post, which holds the
+        HTTP response, the error of http_send when posting failed, or BUSY
+        when the answer to the previous post did not arrive in time.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            if not self._buf:
+                return static_rsp(_walter.ModemState.OK)
+
+            data = bytes(self._buf)
+            self._buf = bytearray()
+
+            posted, rsp = await self._post(data)
+            if not posted:
+                # keep the bodies so the next flush tries again, as long as
+                # they fit next to the ones buffered in the meantime
+                if len(data) + len(self._buf) <= self._max_bytes:
+                    self._buf = bytearray(data) + self._buf
+                else:
+                    print('HTTP batch buffer full, dropping %d bytes.' % len(data))
+
+            return rsp